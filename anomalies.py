@@ -0,0 +1,290 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import shift_engine
+
+# Phát hiện bất thường trực tuyến cho các sự kiện chấm công đi vào (RecPush qua MQTT).
+# Trạng thái nằm trong bộ nhớ, có giới hạn kích thước (LRU), nên không thêm truy vấn DB nào
+# cho mỗi sự kiện. Mỗi tiến trình (worker) có trạng thái riêng.
+#
+#   duplicate_record  RecordID đã gặp gần đây trên cùng thiết bị (thiết bị gửi lại) -> bỏ qua
+#   debounced         cùng người, cùng hướng, cách lượt trước < ANOMALY_DEBOUNCE_SECONDS -> bỏ qua
+#   unknown_person    personId trống hoặc không có trong employees -> vẫn lưu, employee_id NULL
+#   clock_backwards   giờ sự kiện lùi quá ANOMALY_CLOCK_TOLERANCE_SECONDS so với sự kiện trước
+#                     của cùng thiết bị (đồng hồ thiết bị sai/bị chỉnh) -> vẫn lưu
+
+DEBOUNCE_SECONDS = float(os.environ.get("ANOMALY_DEBOUNCE_SECONDS", "10"))
+CLOCK_TOLERANCE_SECONDS = float(os.environ.get("ANOMALY_CLOCK_TOLERANCE_SECONDS", "60"))
+# Số RecordID gần nhất nhớ cho mỗi thiết bị
+RECORD_WINDOW = int(os.environ.get("ANOMALY_RECORD_WINDOW", "1024"))
+MAX_DEVICES = int(os.environ.get("ANOMALY_MAX_DEVICES", "1024"))
+MAX_EMPLOYEES = int(os.environ.get("ANOMALY_MAX_EMPLOYEES", "200000"))
+# personId không tìm thấy được tra lại sau khoảng này (nhân viên có thể vừa được thêm ở worker khác)
+UNKNOWN_PERSON_TTL_SECONDS = float(os.environ.get("ANOMALY_UNKNOWN_PERSON_TTL_SECONDS", "60"))
+
+DROP_KINDS = ("duplicate_record", "debounced")
+KINDS = DROP_KINDS + ("unknown_person", "clock_backwards")
+
+
+def create_anomaly_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_anomalies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        attendance_id INTEGER,
+        person_id TEXT,
+        device TEXT,
+        record_id TEXT,
+        event_time TEXT,
+        detected_at TEXT,
+        detail TEXT,
+        FOREIGN KEY (attendance_id) REFERENCES attendance (id)
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_kind_time ON attendance_anomalies (kind, event_time)")
+
+
+def _epoch(timestamp):
+    """'YYYY-MM-DD HH:MM:SS' -> epoch giây (giờ thiết bị, coi như UTC); sai định dạng -> None."""
+    try:
+        return shift_engine.date_to_epoch(timestamp[:10]) + shift_engine.parse_clock(timestamp[11:19])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class PersonCache:
+    """personId -> employees.id trong bộ nhớ.
+
+    Lần dùng đầu nạp toàn bộ ánh xạ bằng một truy vấn; sau đó chỉ personId chưa biết mới
+    được tra DB, và kết quả "không có" được nhớ trong UNKNOWN_PERSON_TTL_SECONDS.
+    Cache tự làm mới khi đường dẫn DB thay đổi.
+    """
+
+    def __init__(self, db_path, max_size=MAX_EMPLOYEES, unknown_ttl=UNKNOWN_PERSON_TTL_SECONDS):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.unknown_ttl = unknown_ttl
+        self._ids = OrderedDict()
+        self._unknown = OrderedDict()
+        self._loaded_path = None
+        self._lock = threading.Lock()
+
+    def get(self, conn, person_id):
+        if not person_id:
+            return None
+        with self._lock:
+            return self._get(conn, person_id)
+
+    def _get(self, conn, person_id):
+        path = self.db_path()
+        if self._loaded_path != path:
+            self._load(conn, path)
+
+        employee_id = self._ids.get(person_id)
+        if employee_id is not None:
+            self._ids.move_to_end(person_id)
+            return employee_id
+
+        checked_at = self._unknown.get(person_id)
+        if checked_at is not None and time.monotonic() - checked_at < self.unknown_ttl:
+            return None
+
+        row = conn.execute("SELECT id FROM employees WHERE person_id = ?", (person_id,)).fetchone()
+        if row is None:
+            self._unknown[person_id] = time.monotonic()
+            self._unknown.move_to_end(person_id)
+            if len(self._unknown) > self.max_size:
+                self._unknown.popitem(last=False)
+            return None
+        self._unknown.pop(person_id, None)
+        self._remember(person_id, row[0])
+        return row[0]
+
+    def forget(self, person_ids):
+        """Bỏ các kết quả "không có" đã nhớ, gọi sau khi thêm nhân viên."""
+        with self._lock:
+            for person_id in person_ids:
+                self._unknown.pop(person_id, None)
+
+    def _remember(self, person_id, employee_id):
+        self._ids[person_id] = employee_id
+        self._ids.move_to_end(person_id)
+        if len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def _load(self, conn, path):
+        self._ids.clear()
+        self._unknown.clear()
+        cursor = conn.execute(
+            "SELECT person_id, id FROM employees WHERE person_id IS NOT NULL LIMIT ?", (self.max_size,)
+        )
+        for person_id, employee_id in cursor:
+            self._ids[person_id] = employee_id
+        self._loaded_path = path
+
+
+class Verdict:
+    """Kết quả kiểm tra một sự kiện: các loại bất thường và có bỏ qua sự kiện hay không."""
+
+    __slots__ = ("flags", "drop", "device", "record_id", "person_id", "direction", "ts")
+
+    def __init__(self, flags, device, record_id, person_id, direction, ts):
+        self.flags = flags
+        self.drop = any(kind in DROP_KINDS for kind in flags)
+        self.device = device
+        self.record_id = record_id
+        self.person_id = person_id
+        self.direction = direction
+        self.ts = ts
+
+
+class AnomalyDetector:
+    """Cửa sổ trượt theo thiết bị (RecordID gần nhất, giờ sự kiện trước) và theo nhân viên
+    (lượt chấm công được nhận gần nhất).
+
+    inspect() không đổi trạng thái; accept() cập nhật trạng thái ngay (để sự kiện sau trong cùng
+    lô ghi thấy được) và trả về hàm hoàn tác, gọi khi lệnh ghi bị rollback để lần gửi lại
+    không bị coi là trùng. Chỉ gọi từ luồng ghi.
+    """
+
+    def __init__(self, db_path, record_window=RECORD_WINDOW, max_devices=MAX_DEVICES,
+                 max_employees=MAX_EMPLOYEES, debounce_seconds=DEBOUNCE_SECONDS,
+                 clock_tolerance_seconds=CLOCK_TOLERANCE_SECONDS):
+        self.db_path = db_path
+        self.record_window = record_window
+        self.max_devices = max_devices
+        self.max_employees = max_employees
+        self.debounce = debounce_seconds
+        self.clock_tolerance = clock_tolerance_seconds
+        self._path = None
+        self._record_ids = OrderedDict()    # thiết bị -> OrderedDict RecordID gần nhất
+        self._device_times = OrderedDict()  # thiết bị -> epoch của sự kiện trước
+        self._last_punch = OrderedDict()    # personId -> (epoch, direction) lượt được nhận gần nhất
+        self._counters = {"events": 0, "dropped": 0}
+        self._flag_counts = dict.fromkeys(KINDS, 0)
+
+    def inspect(self, info, employee_id):
+        path = self.db_path()
+        if self._path != path:
+            # DB khác (ví dụ benchmark đổi DB_FILE): trạng thái cũ không còn ý nghĩa
+            self._record_ids.clear()
+            self._device_times.clear()
+            self._last_punch.clear()
+            self._path = path
+
+        device = info.get("deviceID") or info.get("facesluiceName") or ""
+        record_id = info.get("RecordID")
+        person_id = info.get("personId")
+        direction = info.get("direction")
+        ts = _epoch(info.get("time"))
+        flags = []
+
+        if record_id is not None and record_id in self._record_ids.get(device, ()):
+            flags.append("duplicate_record")
+        elif ts is not None and person_id:
+            last = self._last_punch.get(person_id)
+            if last is not None and last[1] == direction and abs(ts - last[0]) < self.debounce:
+                flags.append("debounced")
+
+        if employee_id is None:
+            flags.append("unknown_person")
+
+        if ts is not None and "duplicate_record" not in flags:
+            previous = self._device_times.get(device)
+            if previous is not None and ts < previous - self.clock_tolerance:
+                flags.append("clock_backwards")
+
+        return Verdict(flags, device, record_id, person_id, direction, ts)
+
+    def accept(self, verdict):
+        self._counters["events"] += 1
+        for kind in verdict.flags:
+            self._flag_counts[kind] += 1
+        if verdict.drop:
+            self._counters["dropped"] += 1
+            return lambda: None
+
+        previous_time = self._device_times.get(verdict.device)
+        previous_punch = self._last_punch.get(verdict.person_id)
+        if verdict.record_id is not None:
+            record_ids = self._record_ids.get(verdict.device)
+            if record_ids is None:
+                record_ids = self._record_ids[verdict.device] = OrderedDict()
+            record_ids[verdict.record_id] = None
+            if len(record_ids) > self.record_window:
+                record_ids.popitem(last=False)
+            self._touch(self._record_ids, verdict.device, self.max_devices)
+
+        if verdict.ts is not None:
+            # Giữ giờ của sự kiện mới nhất (kể cả khi lùi) để chỉ lần lùi đầu tiên bị đánh dấu
+            self._device_times[verdict.device] = verdict.ts
+            self._touch(self._device_times, verdict.device, self.max_devices)
+            if verdict.person_id:
+                self._last_punch[verdict.person_id] = (verdict.ts, verdict.direction)
+                self._touch(self._last_punch, verdict.person_id, self.max_employees)
+        return lambda: self._undo(verdict, previous_time, previous_punch)
+
+    def _undo(self, verdict, previous_time, previous_punch):
+        """Trả cửa sổ trượt về như trước accept(verdict). Bộ đếm cho /metrics chỉ tăng nên giữ nguyên;
+        mục đã bị đẩy khỏi LRU thì không khôi phục."""
+        if verdict.record_id is not None:
+            self._record_ids.get(verdict.device, {}).pop(verdict.record_id, None)
+        if verdict.ts is not None:
+            _restore(self._device_times, verdict.device, previous_time)
+            if verdict.person_id:
+                _restore(self._last_punch, verdict.person_id, previous_punch)
+
+    @staticmethod
+    def _touch(state, key, max_size):
+        state.move_to_end(key)
+        if len(state) > max_size:
+            state.popitem(last=False)
+
+    # Các số liệu tăng dần trong stats()
+    COUNTERS = ("attendance_ingest_events_total", "attendance_ingest_dropped_total", "attendance_ingest_anomalies_total")
+
+    def stats(self):
+        """Số liệu cho /metrics."""
+        stats = {
+            ("attendance_ingest_events_total", ()): self._counters["events"],
+            ("attendance_ingest_dropped_total", ()): self._counters["dropped"],
+            ("attendance_ingest_tracked_devices", ()): len(self._device_times),
+            ("attendance_ingest_tracked_employees", ()): len(self._last_punch)
+        }
+        for kind, count in self._flag_counts.items():
+            stats[("attendance_ingest_anomalies_total", (("kind", kind),))] = count
+        return stats
+
+
+def _restore(state, key, value):
+    if value is None:
+        state.pop(key, None)
+    else:
+        state[key] = value
+
+
+def record_flags(conn, verdict, attendance_id, info):
+    """Ghi các cờ bất thường vào bảng phụ (cùng transaction với bản ghi chấm công)."""
+    if not verdict.flags:
+        return
+    detected_at = time.strftime("%Y-%m-%d %H:%M:%S")
+    detail = json.dumps({
+        "direction": info.get("direction"),
+        "facesluiceName": info.get("facesluiceName"),
+        "personName": info.get("persionName")
+    }, ensure_ascii=False)
+    conn.executemany(
+        """
+        INSERT INTO attendance_anomalies
+        (kind, attendance_id, person_id, device, record_id, event_time, detected_at, detail)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (kind, attendance_id, verdict.person_id, verdict.device, verdict.record_id,
+             info.get("time"), detected_at, detail)
+            for kind in verdict.flags
+        ]
+    )
@@ -1,16 +1,293 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, send_file, Response
+from array import array
+import bisect
+import datetime
+import gzip
 import json
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
 
 app = Flask(__name__)
 
-# Đọc file JSON khi server khởi động
-with open("chamcongthat.json", "r", encoding="utf-8") as f:
-    attendance_data = json.load(f)
+DATA_FILE = os.environ.get("ATTENDANCE_JSON", "chamcongthat.json")
+# Thư mục chứa các file dựng sẵn: JSON đầy đủ, bản gzip và bản JSON-Lines có chỉ mục
+CACHE_DIR = os.environ.get("ATTENDANCE_CACHE_DIR", "attendance_cache")
+# Chu kỳ kiểm tra file nguồn thay đổi (giây)
+RELOAD_INTERVAL = float(os.environ.get("ATTENDANCE_RELOAD_INTERVAL", "5"))
+# Thư mục dựng cho phiên bản cũ của file nguồn được giữ thêm chừng này giây sau khi có bản mới,
+# để các worker kịp chuyển sang bản mới và request đang dở không mất file
+RETIRE_SECONDS = float(os.environ.get("ATTENDANCE_CACHE_RETIRE_SECONDS", str(max(60.0, 3 * RELOAD_INTERVAL))))
+# Kết quả lọc lớn hơn ngưỡng này được nén gzip nếu client chấp nhận
+GZIP_MIN_BYTES = 64 * 1024
+
+
+# Tiền tố tên thư mục: bản đã dựng xong và bản đang dựng dở (kèm pid của worker dựng)
+DIRECTORY_PREFIX = "data-"
+BUILD_PREFIX = ".build-"
+
+
+def _directory_name(stat):
+    return f"{DIRECTORY_PREFIX}{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _remove_stale_directories(cache_dir, current):
+    """Xóa thư mục của các phiên bản cũ khi bản hiện tại đã có quá RETIRE_SECONDS,
+    và thư mục dựng dở của worker đã chết. Các thư mục lạ trong cache_dir cũng là
+    bản cũ (ví dụ từ phiên bản code trước), nên cũng bị xóa theo cùng điều kiện."""
+    try:
+        retired = time.time() - os.stat(current).st_mtime >= RETIRE_SECONDS
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.abspath(os.path.join(cache_dir, name))
+        if path == current or not os.path.isdir(path):
+            continue
+        if name.startswith(BUILD_PREFIX):
+            pid = name[len(BUILD_PREFIX):].split("-", 1)[0]
+            if pid.isdigit() and _pid_alive(int(pid)):
+                continue
+        elif not retired:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _day_number(value):
+    try:
+        return datetime.date.fromisoformat(str(value)[:10]).toordinal()
+    except ValueError:
+        return -1
+
+
+class AttendanceStore:
+    """Dữ liệu chấm công dựng sẵn từ file JSON nguồn.
+
+    - full.json / full.json.gz: toàn bộ dữ liệu đã serialize một lần, trả về bằng send_file.
+    - records.jsonl: mỗi dòng một bản ghi, sắp xếp theo thời gian, đọc qua mmap.
+    - Chỉ mục trong bộ nhớ chỉ gồm offset/độ dài từng dòng, số ngày của từng dòng và
+      danh sách dòng theo idCard, nên RSS nhỏ kể cả khi file lớn.
+
+    Các file (kể cả chỉ mục) nằm trong một thư mục chung cho mọi worker, đặt tên theo mtime và
+    kích thước file nguồn. Worker đầu tiên dựng vào thư mục tạm rồi đổi tên (atomic); các worker
+    khác chỉ đọc chỉ mục đã dựng.
+    """
+
+    def __init__(self, source, cache_dir):
+        self.source = source
+        stat = os.stat(source)
+        self.mtime_ns = stat.st_mtime_ns
+        self.directory = os.path.abspath(os.path.join(cache_dir, _directory_name(stat)))
+        self.full_path = os.path.join(self.directory, "full.json")
+        self.gzip_path = self.full_path + ".gz"
+        self.lines_path = os.path.join(self.directory, "records.jsonl")
+        self.offsets = array("q")
+        self.lengths = array("l")
+        self.days = array("l")
+        self.by_id_card = {}
+        self.indexed = False
+        if not os.path.isdir(self.directory):
+            self._build(cache_dir)
+        self._load_index()
+        self._file = open(self.lines_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets else None
+
+    def _build(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix=f"{BUILD_PREFIX}{os.getpid()}-", dir=cache_dir)
+        try:
+            self._write_files(build_dir)
+            # Đặt mtime = lúc hoàn tất, dùng để tính thời điểm bản cũ hết hạn
+            os.utime(build_dir)
+            try:
+                os.rename(build_dir, self.directory)
+            except OSError:
+                # Worker khác đã dựng xong cùng phiên bản trước
+                if not os.path.isdir(self.directory):
+                    raise
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    def _write_files(self, directory):
+        with open(self.source, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        # Serialize toàn bộ dữ liệu một lần
+        full_path = os.path.join(directory, "full.json")
+        with open(full_path, "wb") as f:
+            f.write(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        with open(full_path, "rb") as src, gzip.open(full_path + ".gz", "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+
+        records = data if isinstance(data, list) else []
+        order = sorted(
+            range(len(records)),
+            key=lambda i: str(records[i].get("time", "")) if isinstance(records[i], dict) else ""
+        )
+
+        offsets = array("q")
+        lengths = array("l")
+        days = array("l")
+        by_id_card = {}
+        offset = 0
+        with open(os.path.join(directory, "records.jsonl"), "wb") as f:
+            for line_no, i in enumerate(order):
+                record = records[i]
+                line = json.dumps(record, ensure_ascii=False).encode("utf-8")
+                f.write(line)
+                f.write(b"\n")
+                offsets.append(offset)
+                lengths.append(len(line))
+                offset += len(line) + 1
+
+                if isinstance(record, dict):
+                    days.append(_day_number(record.get("time", "")))
+                    id_card = record.get("idCard")
+                    if id_card is not None:
+                        by_id_card.setdefault(str(id_card), []).append(line_no)
+                else:
+                    days.append(-1)
+
+        for name, values in (("offsets", offsets), ("lengths", lengths), ("days", days)):
+            with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+                values.tofile(f)
+        with open(os.path.join(directory, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"indexed": isinstance(data, list), "by_id_card": by_id_card}, f)
+
+    def _load_index(self):
+        for name, values in (("offsets", self.offsets), ("lengths", self.lengths), ("days", self.days)):
+            path = os.path.join(self.directory, f"{name}.bin")
+            with open(path, "rb") as f:
+                values.fromfile(f, os.path.getsize(path) // values.itemsize)
+        with open(os.path.join(self.directory, "index.json"), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.indexed = index["indexed"]
+        self.by_id_card = {id_card: array("l", lines) for id_card, lines in index["by_id_card"].items()}
+
+    def select(self, id_card=None, start_day=None, end_day=None):
+        """Trả về các dòng (bytes JSON) thỏa điều kiện, theo thứ tự thời gian."""
+        if id_card is not None:
+            line_numbers = self.by_id_card.get(str(id_card), ())
+        else:
+            # Dữ liệu đã sắp theo thời gian nên khoảng ngày là một đoạn liên tiếp
+            lo = bisect.bisect_left(self.days, start_day) if start_day is not None else 0
+            hi = bisect.bisect_right(self.days, end_day) if end_day is not None else len(self.days)
+            line_numbers = range(lo, hi)
+
+        lines = []
+        for n in line_numbers:
+            day = self.days[n]
+            if start_day is not None and day < start_day:
+                continue
+            if end_day is not None and day > end_day:
+                continue
+            offset = self.offsets[n]
+            lines.append(self._mmap[offset:offset + self.lengths[n]])
+        return lines
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def load_store():
+    """Dựng lại store nếu file nguồn đổi mtime; giữ store cũ nếu file lỗi/đang ghi dở."""
+    global _store
+    if not os.path.exists(DATA_FILE):
+        return _store
+    mtime_ns = os.stat(DATA_FILE).st_mtime_ns
+    if _store is not None and _store.mtime_ns == mtime_ns:
+        _remove_stale_directories(CACHE_DIR, _store.directory)
+        return _store
+    try:
+        store = AttendanceStore(DATA_FILE, CACHE_DIR)
+    except (ValueError, OSError) as e:
+        print(f"⚠️ Không thể tải {DATA_FILE}: {e}")
+        return _store
+    with _store_lock:
+        _store = store
+    # Thư mục của store cũ không xóa ngay: request đang dở hoặc worker khác có thể vẫn dùng,
+    # nó được dọn sau RETIRE_SECONDS
+    _remove_stale_directories(CACHE_DIR, store.directory)
+    print(f"✅ Đã tải {DATA_FILE}: {len(store.offsets)} bản ghi")
+    return store
+
+
+def _reload_loop():
+    while True:
+        time.sleep(RELOAD_INTERVAL)
+        load_store()
+
+
+def _parse_day(value, name):
+    try:
+        return datetime.date.fromisoformat(value).toordinal()
+    except ValueError:
+        raise ValueError(f"Invalid {name} format. Use YYYY-MM-DD")
+
+
+# Đọc file JSON khi server khởi động và theo dõi thay đổi ở nền
+load_store()
+threading.Thread(target=_reload_loop, name="attendance-reload", daemon=True).start()
+
 
 @app.route("/attendance", methods=["GET"])
 def get_attendance():
-    return jsonify(attendance_data)
+    store = _store
+    if store is None:
+        return jsonify({"error": f"{DATA_FILE} is not available"}), 503
 
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    id_card = request.args.get("idCard")
+    date = request.args.get("date")
+    start = request.args.get("from")
+    end = request.args.get("to")
+    accepts_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+
+    if id_card is None and date is None and start is None and end is None:
+        # Toàn bộ dữ liệu: trả file đã serialize sẵn
+        if accepts_gzip:
+            response = send_file(store.gzip_path, mimetype="application/json", conditional=True)
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            response = send_file(store.full_path, mimetype="application/json", conditional=True)
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
 
+    if not store.indexed:
+        return jsonify({"error": "Filtering requires the data file to be a JSON array"}), 400
+
+    try:
+        start_day = end_day = None
+        if date is not None:
+            start_day = end_day = _parse_day(date, "date")
+        if start is not None:
+            start_day = _parse_day(start, "from")
+        if end is not None:
+            end_day = _parse_day(end, "to")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    body = b"[" + b",".join(store.select(id_card, start_day, end_day)) + b"]"
+    response = Response(body, mimetype="application/json")
+    if accepts_gzip and len(body) >= GZIP_MIN_BYTES:
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000, debug=os.environ.get("FLASK_DEBUG") == "1")
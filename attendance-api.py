@@ -1,12 +1,29 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, send_file
 from flask_cors import CORS
+import csv
+import io
 import json
 import os
 import datetime
-from dateutil.parser import parse
 from functools import wraps
 import sqlite3
-import pandas as pd
+import atexit
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có khóa file, mỗi tiến trình tự import
+    fcntl = None
+
+import anomalies
+import employee_search
+import lookups
+import metrics
+import report_jobs
+import reports
+import shift_engine
+import write_queue
 
 app = Flask(__name__)
 CORS(app)
@@ -14,13 +31,14 @@ CORS(app)
 # Cấu hình cơ sở dữ liệu
 DB_FILE = "attendance.db"
 
-# Khởi tạo cơ sở dữ liệu nếu chưa tồn tại
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
+# Phiên bản schema lưu trong PRAGMA user_version; init_db chỉ chạy các bước còn thiếu.
+# Các bước đều idempotent (IF NOT EXISTS) nên DB tạo trước khi có đánh số (user_version = 0)
+# chạy lại toàn bộ mà không mất dữ liệu.
+SCHEMA_VERSION = 8
+
+def _migrate_base_schema(conn):
     # Tạo bảng employees nếu chưa tồn tại
-    cursor.execute('''
+    conn.execute('''
     CREATE TABLE IF NOT EXISTS employees (
         id INTEGER PRIMARY KEY,
         person_id TEXT UNIQUE,
@@ -32,26 +50,8 @@ def init_db():
     )
     ''')
     
-    # Tạo bảng attendance nếu chưa tồn tại
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS attendance (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        employee_id INTEGER,
-        person_id TEXT,
-        record_id TEXT,
-        timestamp TEXT,
-        direction TEXT,
-        verify_status TEXT,
-        device_name TEXT,
-        open_door_way TEXT,
-        push_type TEXT,
-        raw_data TEXT,
-        FOREIGN KEY (employee_id) REFERENCES employees (id)
-    )
-    ''')
-    
     # Tạo bảng devices
-    cursor.execute('''
+    conn.execute('''
     CREATE TABLE IF NOT EXISTS devices (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         device_id TEXT UNIQUE,
@@ -62,8 +62,83 @@ def init_db():
     )
     ''')
     
-    conn.commit()
-    conn.close()
+    # Các bảng tra cứu mã hóa (direction, verify_status, ...)
+    lookups.create_lookup_tables(conn.cursor())
+    
+    # Tạo bảng attendance nếu chưa tồn tại; chuyển bảng kiểu cũ (cột chuỗi) sang cột mã
+    lookups.migrate_attendance_table(conn)
+    lookups.create_attendance_table(conn)
+
+def _migrate_employee_search(conn):
+    # Chỉ mục tìm kiếm nhân viên (FTS5), đồng bộ bằng trigger
+    employee_search.create_search_index(conn)
+
+def _migrate_import_status(conn):
+    # Tiến độ import file JSON, ghi cùng transaction với dữ liệu nên luôn khớp với số dòng đã commit
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS import_status (
+        source TEXT PRIMARY KEY,
+        status TEXT,
+        records_total INTEGER,
+        records_done INTEGER,
+        started_at TEXT,
+        finished_at TEXT,
+        error TEXT
+    )
+    ''')
+
+def _migrate_anomalies(conn):
+    # Bảng phụ ghi các bất thường phát hiện khi nhận dữ liệu chấm công
+    anomalies.create_anomaly_table(conn)
+
+def _migrate_device_names(conn):
+    # Tên thiết bị của từng bản ghi nằm ở bảng tra cứu riêng; devices chỉ còn thiết bị có deviceID
+    lookups.migrate_device_names(conn)
+
+def _migrate_report_jobs(conn):
+    # Trạng thái job báo cáo dùng chung cho mọi worker
+    report_jobs.create_job_table(conn)
+
+def _migrate_import_file_stat(conn):
+    # mtime/kích thước file đã import, để lần khởi động sau bỏ qua file không đổi
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(import_status)")]
+    for column in ("file_mtime_ns", "file_size"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE import_status ADD COLUMN {column} INTEGER")
+
+def _migrate_report_job_heartbeat(conn):
+    # Heartbeat của tiến trình nhận job, để job của worker đã dừng không "running" mãi
+    report_jobs.add_heartbeat_column(conn)
+
+MIGRATIONS = [
+    (1, _migrate_base_schema),
+    (2, _migrate_employee_search),
+    (3, _migrate_import_status),
+    (4, _migrate_anomalies),
+    (5, _migrate_device_names),
+    (6, _migrate_report_jobs),
+    (7, _migrate_import_file_stat),
+    (8, _migrate_report_job_heartbeat)
+]
+
+# Khởi tạo/nâng cấp cơ sở dữ liệu; không làm gì nếu schema đã ở phiên bản hiện tại
+def init_db():
+    conn = sqlite3.connect(DB_FILE, timeout=30)
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return False
+        
+        # Giữ khóa ghi rồi đọc lại phiên bản: worker khác có thể vừa nâng cấp xong
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migrate in MIGRATIONS:
+            if version < target:
+                migrate(conn)
+        conn.execute(f"PRAGMA user_version = {max(version, SCHEMA_VERSION)}")
+        conn.commit()
+        return True
+    finally:
+        conn.close()
 
 # Middleware để xử lý lỗi cơ sở dữ liệu
 def db_handler(f):
@@ -75,79 +150,202 @@ def db_handler(f):
             return jsonify({"error": f"Database error: {str(e)}"}), 500
         except Exception as e:
             return jsonify({"error": f"Server error: {str(e)}"}), 500
-    return decorated_function
+    
+    if not metrics.ENABLED:
+        return decorated_function
+    
+    # Đo latency theo route khi bật metrics
+    @wraps(f)
+    def instrumented_function(*args, **kwargs):
+        metrics.request_started()
+        started = time.perf_counter()
+        status = 500
+        try:
+            result = decorated_function(*args, **kwargs)
+            if isinstance(result, tuple):
+                status = result[1]
+            else:
+                status = getattr(result, "status_code", 200)
+            return result
+        finally:
+            metrics.request_finished()
+            metrics.observe_request(f.__name__, request.method, status, time.perf_counter() - started)
+    return instrumented_function
 
 # Utility để kết nối và trả về connection và cursor
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
+    if metrics.ENABLED:
+        conn = sqlite3.connect(DB_FILE, factory=metrics.InstrumentedConnection)
+    else:
+        conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row  # Để kết quả trả về dạng dictionary
     return conn
 
-# Hàm nhập dữ liệu từ JSON vào DB
-def import_data_from_json():
-    if os.path.exists("all_recpush_sorted_by_idcard.json"):
-        with open("all_recpush_sorted_by_idcard.json", "r", encoding="utf-8") as f:
+# Bộ ghi duy nhất: mọi lệnh ghi chấm công đi qua hàng đợi và được gom vào một transaction
+writer = write_queue.WriteQueue(lambda: DB_FILE)
+atexit.register(writer.close)
+
+# Trạng thái trong bộ nhớ cho luồng nhận dữ liệu MQTT: personId -> employee_id và bộ phát hiện bất thường
+people = anomalies.PersonCache(lambda: DB_FILE)
+detector = anomalies.AnomalyDetector(lambda: DB_FILE)
+
+# Số dòng tối đa cho một request nhập hàng loạt
+MAX_BULK_ROWS = 50000
+
+def _read_csv_rows(text):
+    # CSV: ô trống coi như không có giá trị
+    return [
+        {key: value for key, value in row.items() if value != ""}
+        for row in csv.DictReader(io.StringIO(text))
+    ]
+
+def read_bulk_rows():
+    """Đọc danh sách dòng từ request: mảng JSON, {"records": [...]}, hoặc CSV
+    (file upload field "file" hoặc body Content-Type text/csv). Lỗi định dạng -> ValueError.
+    Giá trị "" chỉ bị bỏ với CSV; với JSON, "" là giá trị gửi lên (ví dụ để xóa một trường)."""
+    if "file" in request.files:
+        rows = _read_csv_rows(request.files["file"].read().decode("utf-8-sig"))
+    elif request.mimetype == "text/csv":
+        rows = _read_csv_rows(request.get_data(as_text=True).lstrip("\ufeff"))
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get("records")
+        if not isinstance(data, list):
+            raise ValueError("Expected a JSON array, {\"records\": [...]} or a CSV upload")
+        rows = data
+    
+    if len(rows) > MAX_BULK_ROWS:
+        raise ValueError(f"Too many rows: {len(rows)} (max {MAX_BULK_ROWS})")
+    return rows
+
+def chunked(values, size=500):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+# File dữ liệu nhập khi khởi động và số bản ghi mỗi transaction (tiến độ cập nhật sau mỗi phần)
+IMPORT_FILE = "all_recpush_sorted_by_idcard.json"
+IMPORT_CHUNK_ROWS = 5000
+
+def _set_import_status(conn, **fields):
+    fields["source"] = IMPORT_FILE
+    columns = ", ".join(fields)
+    placeholders = ", ".join(f":{name}" for name in fields)
+    updates = ", ".join(f"{name} = excluded.{name}" for name in fields if name != "source")
+    conn.execute(
+        f"INSERT INTO import_status ({columns}) VALUES ({placeholders}) "
+        f"ON CONFLICT(source) DO UPDATE SET {updates}",
+        fields
+    )
+
+# Hàm nhập dữ liệu từ JSON vào DB; start: số bản ghi đầu đã được nhập ở lần trước (nhập tiếp)
+def import_data_from_json(start=0):
+    if not os.path.exists(IMPORT_FILE):
+        return False
+    
+    def now():
+        return datetime.datetime.now().isoformat(timespec="seconds")
+    
+    started_at = now()
+    try:
+        with open(IMPORT_FILE, "r", encoding="utf-8") as f:
             records = json.load(f)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Import nhân viên
-        unique_employees = {}
-        for record in records:
-            person_id = record.get("personId")
-            if person_id and person_id not in unique_employees:
-                unique_employees[person_id] = {
-                    "id_card": record.get("idCard"),
-                    "name": record.get("persionName"),
-                    "person_id": person_id
-                }
-        
-        # Thêm nhân viên vào DB
-        for person_id, emp_data in unique_employees.items():
-            try:
-                cursor.execute(
-                    "INSERT OR IGNORE INTO employees (person_id, id_card, name) VALUES (?, ?, ?)",
-                    (emp_data["person_id"], emp_data["id_card"], emp_data["name"])
-                )
-            except sqlite3.IntegrityError:
-                pass  # Ignore if employee already exists
-        
-        # Import dữ liệu chấm công
-        for record in records:
-            employee_id = None
-            person_id = record.get("personId")
+        def write_employees(conn):
+            cursor = conn.cursor()
             
-            if person_id:
-                cursor.execute("SELECT id FROM employees WHERE person_id = ?", (person_id,))
-                result = cursor.fetchone()
-                if result:
-                    employee_id = result["id"]
+            # Import nhân viên
+            unique_employees = {}
+            for record in records:
+                person_id = record.get("personId")
+                if person_id and person_id not in unique_employees:
+                    unique_employees[person_id] = {
+                        "id_card": record.get("idCard"),
+                        "name": record.get("persionName"),
+                        "person_id": person_id
+                    }
             
-            cursor.execute(
-                """
-                INSERT OR IGNORE INTO attendance 
-                (employee_id, person_id, record_id, timestamp, direction, verify_status, device_name, open_door_way, push_type, raw_data)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    employee_id,
-                    person_id,
-                    record.get("RecordID"),
-                    record.get("time"),
-                    record.get("direction"),
-                    record.get("VerifyStatus"),
-                    record.get("facesluiceName"),
-                    record.get("OpendoorWay"),
-                    record.get("PushType"),
-                    json.dumps(record.get("mqtt", {}))
-                )
+            # Thêm nhân viên vào DB
+            for person_id, emp_data in unique_employees.items():
+                try:
+                    cursor.execute(
+                        "INSERT OR IGNORE INTO employees (person_id, id_card, name) VALUES (?, ?, ?)",
+                        (emp_data["person_id"], emp_data["id_card"], emp_data["name"])
+                    )
+                except sqlite3.IntegrityError:
+                    pass  # Ignore if employee already exists
+            
+            _set_import_status(
+                conn, status="running", records_total=len(records), records_done=start,
+                started_at=started_at, finished_at=None, error=None
             )
         
-        conn.commit()
-        conn.close()
+        def write_attendance(chunk, done):
+            def write(conn):
+                cursor = conn.cursor()
+                
+                # Import dữ liệu chấm công
+                for record in chunk:
+                    employee_id = None
+                    person_id = record.get("personId")
+                    
+                    if person_id:
+                        cursor.execute("SELECT id FROM employees WHERE person_id = ?", (person_id,))
+                        result = cursor.fetchone()
+                        if result:
+                            employee_id = result["id"]
+                    
+                    codes = lookups.encode_values(conn, {
+                        "direction": record.get("direction"),
+                        "verify_status": record.get("VerifyStatus"),
+                        "device_name": record.get("facesluiceName"),
+                        "open_door_way": record.get("OpendoorWay"),
+                        "push_type": record.get("PushType")
+                    })
+                    
+                    cursor.execute(
+                        """
+                        INSERT OR IGNORE INTO attendance 
+                        (employee_id, person_id, record_id, timestamp, direction_id, verify_status_id, device_name_id, open_door_way_id, push_type_id, raw_data)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            employee_id,
+                            person_id,
+                            record.get("RecordID"),
+                            record.get("time"),
+                            codes["direction_id"],
+                            codes["verify_status_id"],
+                            codes["device_name_id"],
+                            codes["open_door_way_id"],
+                            codes["push_type_id"],
+                            json.dumps(record.get("mqtt", {}))
+                        )
+                    )
+                
+                finished = done == len(records)
+                _set_import_status(
+                    conn, status="done" if finished else "running", records_done=done,
+                    finished_at=now() if finished else None
+                )
+            return write
+        
+        # Ghi qua bộ ghi chung, từng phần IMPORT_CHUNK_ROWS bản ghi để không giữ khóa ghi quá lâu
+        writer.execute(write_employees)
+        people.forget(record.get("personId") for record in records)
+        # records_done được commit cùng transaction với từng phần nên là điểm nhập tiếp chính xác
+        for offset in range(start, len(records), IMPORT_CHUNK_ROWS):
+            chunk = records[offset:offset + IMPORT_CHUNK_ROWS]
+            writer.execute(write_attendance(chunk, offset + len(chunk)), rows=len(chunk))
+        if start >= len(records):
+            writer.execute(lambda conn: _set_import_status(conn, status="done", finished_at=now()))
         return True
-    return False
+    except Exception as e:
+        # Lấy chuỗi lỗi trước: lambda có thể chạy trên thread ghi sau khi khối except đã kết thúc
+        error = str(e)
+        writer.execute(lambda conn: _set_import_status(conn, status="failed", finished_at=now(), error=error))
+        raise
 
 # API Routes
 
@@ -167,7 +365,7 @@ def get_all_attendance():
     query = """
     SELECT 
         a.id, a.employee_id, a.person_id, a.record_id, a.timestamp, 
-        a.direction, a.verify_status, a.device_name, a.open_door_way,
+        a.direction_id, a.verify_status_id, a.device_name_id, a.open_door_way_id,
         e.name as employee_name, e.id_card
     FROM attendance a
     LEFT JOIN employees e ON a.employee_id = e.id
@@ -176,7 +374,7 @@ def get_all_attendance():
     """
     
     cursor = conn.execute(query, (per_page, offset))
-    attendance_records = [dict(row) for row in cursor.fetchall()]
+    attendance_records = lookups.decode_rows(conn, cursor.fetchall())
     
     conn.close()
     
@@ -198,7 +396,7 @@ def get_attendance_by_id(record_id):
     query = """
     SELECT 
         a.id, a.employee_id, a.person_id, a.record_id, a.timestamp, 
-        a.direction, a.verify_status, a.device_name, a.open_door_way, a.raw_data,
+        a.direction_id, a.verify_status_id, a.device_name_id, a.open_door_way_id, a.raw_data,
         e.name as employee_name, e.id_card, e.department, e.position
     FROM attendance a
     LEFT JOIN employees e ON a.employee_id = e.id
@@ -207,11 +405,13 @@ def get_attendance_by_id(record_id):
     
     cursor = conn.execute(query, (record_id,))
     record = cursor.fetchone()
+    if record:
+        record = lookups.decode_row(conn, record)
     
     conn.close()
     
     if record:
-        return jsonify(dict(record))
+        return jsonify(record)
     else:
         return jsonify({"error": "Record not found"}), 404
 
@@ -233,7 +433,7 @@ def get_attendance_by_employee(employee_id):
     query = """
     SELECT 
         a.id, a.employee_id, a.person_id, a.record_id, a.timestamp, 
-        a.direction, a.verify_status, a.device_name, a.open_door_way,
+        a.direction_id, a.verify_status_id, a.device_name_id, a.open_door_way_id,
         e.name as employee_name, e.id_card, e.department, e.position
     FROM attendance a
     LEFT JOIN employees e ON a.employee_id = e.id
@@ -243,7 +443,7 @@ def get_attendance_by_employee(employee_id):
     """
     
     cursor = conn.execute(query, (employee_id, per_page, offset))
-    attendance_records = [dict(row) for row in cursor.fetchall()]
+    attendance_records = lookups.decode_rows(conn, cursor.fetchall())
     
     conn.close()
     
@@ -282,7 +482,7 @@ def get_attendance_by_date(date):
     query = """
     SELECT 
         a.id, a.employee_id, a.person_id, a.record_id, a.timestamp, 
-        a.direction, a.verify_status, a.device_name, a.open_door_way,
+        a.direction_id, a.verify_status_id, a.device_name_id, a.open_door_way_id,
         e.name as employee_name, e.id_card, e.department, e.position
     FROM attendance a
     LEFT JOIN employees e ON a.employee_id = e.id
@@ -292,7 +492,7 @@ def get_attendance_by_date(date):
     """
     
     cursor = conn.execute(query, (date_str, per_page, offset))
-    attendance_records = [dict(row) for row in cursor.fetchall()]
+    attendance_records = lookups.decode_rows(conn, cursor.fetchall())
     
     conn.close()
     
@@ -306,143 +506,143 @@ def get_attendance_by_date(date):
         }
     })
 
+@app.route("/api/v1/attendance/anomalies", methods=["GET"])
+@db_handler
+def get_attendance_anomalies():
+    """Các bất thường phát hiện khi nhận dữ liệu (mới nhất trước), lọc theo kind, kèm số lượng theo loại."""
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
+    offset = (page - 1) * per_page
+    kind = request.args.get("kind")
+    if kind is not None and kind not in anomalies.KINDS:
+        return jsonify({"error": f"kind must be one of: {', '.join(anomalies.KINDS)}"}), 400
+    
+    conn = get_db_connection()
+    
+    counts = {name: 0 for name in anomalies.KINDS}
+    for row in conn.execute("SELECT kind, COUNT(*) as count FROM attendance_anomalies GROUP BY kind"):
+        counts[row["kind"]] = row["count"]
+    total_records = counts[kind] if kind else sum(counts.values())
+    
+    if kind:
+        cursor = conn.execute(
+            "SELECT * FROM attendance_anomalies WHERE kind = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (kind, per_page, offset)
+        )
+    else:
+        cursor = conn.execute(
+            "SELECT * FROM attendance_anomalies ORDER BY id DESC LIMIT ? OFFSET ?", (per_page, offset)
+        )
+    records = [dict(row) for row in cursor.fetchall()]
+    
+    conn.close()
+    
+    return jsonify({
+        "data": records,
+        "counts": counts,
+        "pagination": {
+            "total": total_records,
+            "page": page,
+            "per_page": per_page,
+            "total_pages": (total_records + per_page - 1) // per_page
+        }
+    })
+
 @app.route("/api/v1/attendance/report", methods=["GET"])
 @db_handler
 def get_attendance_report():
     # Các tham số lọc
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
+    start_date, end_date = reports.default_date_range(
+        request.args.get('start_date'),
+        request.args.get('end_date')
+    )
     department = request.args.get('department')
     employee_id = request.args.get('employee_id')
+    shift = request.args.get('shift', shift_engine.DEFAULT_SHIFT)
     
-    if not start_date:
-        # Mặc định là đầu tháng hiện tại
-        today = datetime.datetime.now()
-        start_date = datetime.datetime(today.year, today.month, 1).strftime("%Y-%m-%d")
+    try:
+        datetime.datetime.strptime(start_date, "%Y-%m-%d")
+        datetime.datetime.strptime(end_date, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
     
-    if not end_date:
-        # Mặc định là ngày hiện tại
-        end_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    if shift not in shift_engine.load_shift_templates():
+        return jsonify({"error": f"Unknown shift template: {shift}"}), 400
     
     conn = get_db_connection()
+    report_list = reports.build_attendance_report(conn, start_date, end_date, department, employee_id, shift)
+    conn.close()
     
-    # Xây dựng query động dựa trên các tham số lọc
-    query_parts = [
-        "SELECT e.id, e.name, e.id_card, e.department, e.position, a.timestamp, a.direction, a.device_name",
-        "FROM employees e",
-        "LEFT JOIN attendance a ON e.id = a.employee_id",
-        "WHERE e.active = 1"
-    ]
-    query_params = []
+    return jsonify({
+        "start_date": start_date,
+        "end_date": end_date,
+        "shift": shift,
+        "data": report_list
+    })
+
+# Báo cáo lớn: chạy song song trên nhiều tiến trình (submit -> poll -> download)
+@app.route("/api/v1/attendance/report/jobs", methods=["POST"])
+@db_handler
+def submit_attendance_report_job():
+    data = request.json or {}
     
-    if start_date:
-        query_parts.append("AND date(a.timestamp) >= ?")
-        query_params.append(start_date)
+    start_date, end_date = reports.default_date_range(data.get('start_date'), data.get('end_date'))
+    shift = data.get('shift', shift_engine.DEFAULT_SHIFT)
+    shard_by = data.get('shard_by', 'employee')
     
-    if end_date:
-        query_parts.append("AND date(a.timestamp) <= ?")
-        query_params.append(end_date)
+    try:
+        datetime.datetime.strptime(start_date, "%Y-%m-%d")
+        datetime.datetime.strptime(end_date, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
     
-    if department:
-        query_parts.append("AND e.department = ?")
-        query_params.append(department)
+    if shift not in shift_engine.load_shift_templates():
+        return jsonify({"error": f"Unknown shift template: {shift}"}), 400
     
-    if employee_id:
-        query_parts.append("AND e.id = ?")
-        query_params.append(employee_id)
+    if shard_by not in ("employee", "department"):
+        return jsonify({"error": "shard_by must be 'employee' or 'department'"}), 400
     
-    query_parts.append("ORDER BY e.id, a.timestamp")
+    job_id = report_jobs.submit_report_job(
+        DB_FILE, start_date, end_date,
+        department=data.get('department'),
+        employee_id=data.get('employee_id'),
+        shift=shift,
+        shard_by=shard_by
+    )
     
-    query = " ".join(query_parts)
-    cursor = conn.execute(query, query_params)
-    records = [dict(row) for row in cursor.fetchall()]
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/api/v1/attendance/report/jobs/{job_id}",
+        "result_url": f"/api/v1/attendance/report/jobs/{job_id}/result"
+    }), 202
+
+@app.route("/api/v1/attendance/report/jobs/<job_id>", methods=["GET"])
+@db_handler
+def get_attendance_report_job(job_id):
+    job = report_jobs.get_job(DB_FILE, job_id)
+    if not job:
+        return jsonify({"error": "Report job not found"}), 404
     
-    # Xử lý dữ liệu thành báo cáo
-    report_data = {}
-    
-    for record in records:
-        emp_id = record["id"]
-        if emp_id not in report_data:
-            report_data[emp_id] = {
-                "employee_id": emp_id,
-                "name": record["name"],
-                "id_card": record["id_card"],
-                "department": record["department"],
-                "position": record["position"],
-                "days": {}
-            }
-        
-        if record["timestamp"]:
-            date = record["timestamp"].split(" ")[0]  # Lấy phần ngày từ timestamp
-            time = record["timestamp"].split(" ")[1]  # Lấy phần giờ từ timestamp
-            direction = record["direction"]
-            
-            if date not in report_data[emp_id]["days"]:
-                report_data[emp_id]["days"][date] = {
-                    "in": [],
-                    "out": []
-                }
-            
-            if direction == "in":
-                report_data[emp_id]["days"][date]["in"].append({
-                    "time": time,
-                    "device": record["device_name"]
-                })
-            elif direction == "out":
-                report_data[emp_id]["days"][date]["out"].append({
-                    "time": time,
-                    "device": record["device_name"]
-                })
-    
-    # Chuyển đổi từ dictionary sang danh sách
-    report_list = list(report_data.values())
-    
-    # Tính toán thêm các chỉ số: giờ làm, giờ vào sớm/muộn, giờ ra sớm/muộn
-    for employee in report_list:
-        total_work_hours = 0
-        total_days = 0
-        days_with_records = 0
-        
-        for date, records in employee["days"].items():
-            # Sắp xếp theo thời gian
-            if records["in"]:
-                records["in"].sort(key=lambda x: x["time"])
-            if records["out"]:
-                records["out"].sort(key=lambda x: x["time"])
-            
-            # Nếu có cả check-in và check-out
-            if records["in"] and records["out"]:
-                days_with_records += 1
-                first_in = records["in"][0]["time"]
-                last_out = records["out"][-1]["time"]
-                
-                # Tính số giờ làm việc
-                try:
-                    t_in = datetime.datetime.strptime(first_in, "%H:%M:%S")
-                    t_out = datetime.datetime.strptime(last_out, "%H:%M:%S")
-                    delta = t_out - t_in
-                    hours = delta.total_seconds() / 3600
-                    total_work_hours += hours
-                    records["work_hours"] = round(hours, 2)
-                except Exception as e:
-                    records["work_hours"] = None
-            
-            total_days += 1
-        
-        employee["summary"] = {
-            "total_days": total_days,
-            "days_with_records": days_with_records,
-            "average_work_hours": round(total_work_hours / days_with_records, 2) if days_with_records > 0 else 0,
-            "attendance_rate": round((days_with_records / total_days) * 100, 2) if total_days > 0 else 0
-        }
+    return jsonify(report_jobs.job_status(job))
+
+@app.route("/api/v1/attendance/report/jobs/<job_id>/result", methods=["GET"])
+@db_handler
+def download_attendance_report_job(job_id):
+    job = report_jobs.get_job(DB_FILE, job_id)
+    if not job:
+        return jsonify({"error": "Report job not found"}), 404
     
-    conn.close()
+    if job["status"] == "failed":
+        return jsonify({"error": f"Report job failed: {job['error']}"}), 500
     
-    return jsonify({
-        "start_date": start_date,
-        "end_date": end_date,
-        "data": report_list
-    })
+    if job["status"] != "done":
+        return jsonify(report_jobs.job_status(job)), 202
+    
+    # File kết quả đã có sẵn nội dung trả về
+    return send_file(
+        job["result_path"], mimetype="application/json",
+        as_attachment=True, download_name=f"attendance_report_{job_id}.json"
+    )
 
 @app.route("/api/v1/attendance/manual", methods=["POST"])
 @db_handler
@@ -459,36 +659,130 @@ def add_manual_attendance():
     cursor = conn.execute("SELECT id, person_id FROM employees WHERE id = ?", (data["employee_id"],))
     employee = cursor.fetchone()
     
+    conn.close()
+    
     if not employee:
-        conn.close()
         return jsonify({"error": "Employee not found with the given ID"}), 404
     
     # Thêm bản ghi chấm công thủ công
-    cursor.execute(
-        """
-        INSERT INTO attendance 
-        (employee_id, person_id, timestamp, direction, verify_status, device_name)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (
-            data["employee_id"],
-            employee["person_id"],
-            data["timestamp"],
-            data["direction"],
-            data.get("verify_status", "Manual"),
-            data.get("device_name", "Manual Input")
+    def write(conn):
+        codes = lookups.encode_values(conn, {
+            "direction": data["direction"],
+            "verify_status": data.get("verify_status", "Manual"),
+            "device_name": data.get("device_name", "Manual Input")
+        })
+        cursor = conn.execute(
+            """
+            INSERT INTO attendance 
+            (employee_id, person_id, timestamp, direction_id, verify_status_id, device_name_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                data["employee_id"],
+                employee["person_id"],
+                data["timestamp"],
+                codes["direction_id"],
+                codes["verify_status_id"],
+                codes["device_name_id"]
+            )
         )
-    )
+        return cursor.lastrowid
     
-    conn.commit()
-    last_id = cursor.lastrowid
-    conn.close()
+    last_id = writer.execute(write)
     
     return jsonify({
         "id": last_id,
         "message": "Manual attendance record added successfully"
     }), 201
 
+@app.route("/api/v1/attendance/manual/bulk", methods=["POST"])
+@db_handler
+def add_manual_attendance_bulk():
+    try:
+        rows = read_bulk_rows()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    results = [None] * len(rows)
+    valid = []
+    
+    # Kiểm tra dữ liệu từng dòng (một lượt)
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[index] = {"row": index, "status": "error", "error": "Row must be an object"}
+            continue
+        missing = [field for field in ("employee_id", "timestamp", "direction") if field not in row]
+        if missing:
+            results[index] = {"row": index, "status": "error", "error": f"Missing required field: {missing[0]}"}
+            continue
+        try:
+            employee_id = int(row["employee_id"])
+            datetime.datetime.strptime(row["timestamp"], "%Y-%m-%d %H:%M:%S")
+        except (TypeError, ValueError):
+            results[index] = {"row": index, "status": "error", "error": "Invalid employee_id or timestamp (YYYY-MM-DD HH:MM:SS)"}
+            continue
+        if row["direction"] not in ("in", "out"):
+            results[index] = {"row": index, "status": "error", "error": "direction must be 'in' or 'out'"}
+            continue
+        valid.append((index, employee_id, row))
+    
+    conn = get_db_connection()
+    
+    # Kiểm tra nhân viên tồn tại bằng vài truy vấn IN thay vì một truy vấn mỗi dòng
+    person_ids = {}
+    for chunk in chunked({employee_id for _, employee_id, _ in valid}):
+        cursor = conn.execute(
+            f"SELECT id, person_id FROM employees WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+        )
+        person_ids.update((row["id"], row["person_id"]) for row in cursor)
+    conn.close()
+    
+    inserted = []
+    for index, employee_id, row in valid:
+        if employee_id not in person_ids:
+            results[index] = {"row": index, "status": "error", "error": "Employee not found with the given ID"}
+            continue
+        inserted.append((index, employee_id, row))
+    
+    # Ghi tất cả dòng hợp lệ trong một transaction của bộ ghi chung
+    def write(conn):
+        params = []
+        for _, employee_id, row in inserted:
+            codes = lookups.encode_values(conn, {
+                "direction": row["direction"],
+                "verify_status": row.get("verify_status", "Manual"),
+                "device_name": row.get("device_name", "Manual Input")
+            })
+            params.append((
+                employee_id,
+                person_ids[employee_id],
+                row["timestamp"],
+                codes["direction_id"],
+                codes["verify_status_id"],
+                codes["device_name_id"]
+            ))
+        conn.executemany(
+            """
+            INSERT INTO attendance 
+            (employee_id, person_id, timestamp, direction_id, verify_status_id, device_name_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            params
+        )
+        # Bộ ghi giữ khóa ghi nên id được cấp liên tiếp
+        return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    
+    if inserted:
+        last_id = writer.execute(write, rows=len(inserted))
+        for offset, (index, _, _) in enumerate(inserted):
+            results[index] = {"row": index, "status": "created", "id": last_id - len(inserted) + 1 + offset}
+    
+    return jsonify({
+        "created": len(inserted),
+        "failed": len(rows) - len(inserted),
+        "results": results
+    })
+
 @app.route("/api/v1/employees", methods=["GET"])
 @db_handler
 def get_all_employees():
@@ -499,6 +793,26 @@ def get_all_employees():
     
     return jsonify(employees)
 
+@app.route("/api/v1/employees/search", methods=["GET"])
+@db_handler
+def search_employees():
+    """Tìm nhân viên theo tên (không phân biệt dấu), id_card, person_id hoặc phòng ban;
+    từ cuối khớp theo tiền tố để dùng cho ô gợi ý khi đang gõ."""
+    query = request.args.get("q", "")
+    include_inactive = request.args.get("include_inactive", "0") == "1"
+    try:
+        limit = int(request.args.get("limit", employee_search.DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1 or limit > employee_search.MAX_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {employee_search.MAX_LIMIT}"}), 400
+    
+    conn = get_db_connection()
+    employees = employee_search.search(conn, query, limit, include_inactive)
+    conn.close()
+    
+    return jsonify(employees)
+
 @app.route("/api/v1/employees/<int:employee_id>", methods=["GET"])
 @db_handler
 def get_employee_by_id(employee_id):
@@ -520,7 +834,7 @@ def get_employee_by_id(employee_id):
         """, 
         (employee_id,)
     )
-    recent_attendance = [dict(row) for row in cursor.fetchall()]
+    recent_attendance = lookups.decode_rows(conn, cursor.fetchall())
     
     result = dict(employee)
     result["recent_attendance"] = recent_attendance
@@ -556,6 +870,7 @@ def add_employee():
         
         conn.commit()
         last_id = cursor.lastrowid
+        people.forget([data["person_id"]])
         
         conn.close()
         return jsonify({
@@ -568,6 +883,114 @@ def add_employee():
             return jsonify({"error": "Employee with the same ID card or person ID already exists"}), 409
         return jsonify({"error": str(e)}), 400
 
+@app.route("/api/v1/employees/bulk", methods=["POST"])
+@db_handler
+def upsert_employees_bulk():
+    """Thêm mới hoặc cập nhật nhân viên theo person_id. Trường không có trong dòng
+    (department, position, active) giữ nguyên giá trị cũ khi cập nhật."""
+    try:
+        rows = read_bulk_rows()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    results = [None] * len(rows)
+    valid = []
+    seen_person_ids = {}
+    seen_id_cards = {}
+    
+    # Kiểm tra dữ liệu từng dòng và trùng lặp trong cùng request (một lượt)
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[index] = {"row": index, "status": "error", "error": "Row must be an object"}
+            continue
+        missing = [field for field in ("name", "id_card", "person_id") if field not in row]
+        if missing:
+            results[index] = {"row": index, "status": "error", "error": f"Missing required field: {missing[0]}"}
+            continue
+        try:
+            id_card = int(row["id_card"])
+            active = int(row["active"]) if "active" in row else None
+        except (TypeError, ValueError):
+            results[index] = {"row": index, "status": "error", "error": "id_card and active must be integers"}
+            continue
+        person_id = str(row["person_id"])
+        if person_id in seen_person_ids or id_card in seen_id_cards:
+            results[index] = {"row": index, "status": "error", "error": "Duplicate person_id or id_card in request"}
+            continue
+        seen_person_ids[person_id] = index
+        seen_id_cards[id_card] = index
+        valid.append((index, {
+            "name": row["name"],
+            "id_card": id_card,
+            "person_id": person_id,
+            "department": row.get("department"),
+            "position": row.get("position"),
+            "active": active
+        }))
+    
+    conn = get_db_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    
+    # Nhân viên đã có (theo person_id) và chủ sở hữu hiện tại của các id_card
+    existing = {}
+    for chunk in chunked(seen_person_ids):
+        cursor = conn.execute(
+            f"SELECT id, person_id FROM employees WHERE person_id IN ({', '.join('?' * len(chunk))})", chunk
+        )
+        existing.update((row["person_id"], row["id"]) for row in cursor)
+    card_owners = {}
+    for chunk in chunked(seen_id_cards):
+        cursor = conn.execute(
+            f"SELECT id_card, person_id FROM employees WHERE id_card IN ({', '.join('?' * len(chunk))})", chunk
+        )
+        card_owners.update((row["id_card"], row["person_id"]) for row in cursor)
+    
+    params = []
+    for index, employee in valid:
+        owner = card_owners.get(employee["id_card"])
+        if owner is not None and owner != employee["person_id"]:
+            results[index] = {"row": index, "status": "error", "error": "id_card already belongs to another employee"}
+            continue
+        params.append((index, employee))
+    
+    if params:
+        conn.executemany(
+            """
+            INSERT INTO employees (name, id_card, person_id, department, position, active)
+            VALUES (:name, :id_card, :person_id, COALESCE(:department, ''), COALESCE(:position, ''), COALESCE(:active, 1))
+            ON CONFLICT(person_id) DO UPDATE SET
+                name = excluded.name,
+                id_card = excluded.id_card,
+                department = COALESCE(:department, department),
+                position = COALESCE(:position, position),
+                active = COALESCE(:active, active)
+            """,
+            [employee for _, employee in params]
+        )
+        ids = {}
+        for chunk in chunked(employee["person_id"] for _, employee in params):
+            cursor = conn.execute(
+                f"SELECT id, person_id FROM employees WHERE person_id IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            ids.update((row["person_id"], row["id"]) for row in cursor)
+        for index, employee in params:
+            results[index] = {
+                "row": index,
+                "status": "updated" if employee["person_id"] in existing else "created",
+                "id": ids[employee["person_id"]]
+            }
+    
+    conn.commit()
+    conn.close()
+    people.forget(employee["person_id"] for _, employee in params)
+    
+    return jsonify({
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "updated": sum(1 for r in results if r["status"] == "updated"),
+        "failed": sum(1 for r in results if r["status"] == "error"),
+        "results": results
+    })
+
 @app.route("/api/v1/employees/<int:employee_id>", methods=["PUT"])
 @db_handler
 def update_employee(employee_id):
@@ -628,67 +1051,204 @@ def process_mqtt_data():
     info = data.get("info", {})
     person_id = info.get("personId")
     
-    conn = get_db_connection()
-    
-    # Tìm nhân viên theo person_id
-    employee_id = None
-    if person_id:
-        cursor = conn.execute("SELECT id FROM employees WHERE person_id = ?", (person_id,))
-        result = cursor.fetchone()
-        if result:
-            employee_id = result["id"]
-    
-    # Thêm bản ghi chấm công
-    cursor = conn.execute(
-        """
-        INSERT INTO attendance 
-        (employee_id, person_id, record_id, timestamp, direction, verify_status, device_name, open_door_way, push_type, raw_data)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            employee_id,
-            person_id,
-            info.get("RecordID"),
-            info.get("time"),
-            info.get("direction"),
-            info.get("VerifyStatus"),
-            info.get("facesluiceName"),
-            info.get("OpendoorWay"),
-            info.get("PushType"),
-            json.dumps(info)
-        )
-    )
-    
-    # Cập nhật thông tin thiết bị
-    device_id = info.get("deviceID")
-    if device_id:
-        device_name = info.get("facesluiceName", "Unknown Device")
+    def write(conn):
+        # Tìm nhân viên theo person_id (cache trong bộ nhớ) và kiểm tra bất thường
+        employee_id = people.get(conn, person_id)
+        verdict = detector.inspect(info, employee_id)
+        if verdict.drop:
+            # Bản ghi trùng/lặp nhanh: chỉ ghi cờ, không thêm vào attendance
+            anomalies.record_flags(conn, verdict, None, info)
+            detector.accept(verdict)
+            return None, verdict.flags
         
-        conn.execute(
+        # Mã hóa các trường tra cứu; nếu có deviceID thì đồng thời cập nhật thông tin thiết bị
+        codes = lookups.encode_values(conn, {
+            "direction": info.get("direction"),
+            "verify_status": info.get("VerifyStatus"),
+            "device_name": info.get("facesluiceName"),
+            "open_door_way": info.get("OpendoorWay"),
+            "push_type": info.get("PushType")
+        }, device_id=info.get("deviceID"))
+        
+        # Thêm bản ghi chấm công
+        cursor = conn.execute(
             """
-            INSERT OR REPLACE INTO devices (device_id, name, status, last_active)
-            VALUES (?, ?, 'active', datetime('now'))
+            INSERT INTO attendance 
+            (employee_id, person_id, record_id, timestamp, direction_id, verify_status_id, device_name_id, open_door_way_id, push_type_id, raw_data)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (device_id, device_name)
+            (
+                employee_id,
+                person_id,
+                info.get("RecordID"),
+                info.get("time"),
+                codes["direction_id"],
+                codes["verify_status_id"],
+                codes["device_name_id"],
+                codes["open_door_way_id"],
+                codes["push_type_id"],
+                json.dumps(info)
+            )
         )
+        anomalies.record_flags(conn, verdict, cursor.lastrowid, info)
+        # Cập nhật cửa sổ trượt ngay cho các sự kiện sau trong lô; hoàn tác nếu lô không COMMIT được
+        writer.on_rollback(detector.accept(verdict))
+        return cursor.lastrowid, verdict.flags
     
-    conn.commit()
-    last_id = cursor.lastrowid
-    conn.close()
+    # Ghi qua bộ ghi chung: các sự kiện đến cùng lúc được commit chung một transaction
+    last_id, flags = writer.execute(write)
+    
+    if last_id is None:
+        return jsonify({
+            "id": None,
+            "flags": flags,
+            "message": "Duplicate punch ignored"
+        }), 200
     
     return jsonify({
         "id": last_id,
+        "flags": flags,
         "message": "MQTT data processed successfully"
     }), 201
 
-# Import dữ liệu khi khởi động
-@app.before_first_request
-def before_first_request():
-    init_db()
-    import_data_from_json()
+# Số liệu hiệu năng cho Prometheus
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    if not metrics.ENABLED:
+        return jsonify({"error": "Metrics are disabled. Set METRICS_ENABLED=1"}), 404
+    
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+metrics.register_provider(lambda: report_jobs.queue_stats(DB_FILE))
+metrics.register_provider(writer.stats, counters=write_queue.WriteQueue.COUNTERS)
+metrics.register_provider(detector.stats, counters=anomalies.AnomalyDetector.COUNTERS)
+
+# Khởi tạo DB khi khởi động; import dữ liệu chạy nền để server nhận request ngay.
+# Server gọi startup() trước khi nhận request (xem attendance_asgi.py); tiến trình cha đã chạy
+# startup() thì đặt ATTENDANCE_STARTUP_DONE=1 để các worker con không chạy lại.
+_startup_done = os.environ.get("ATTENDANCE_STARTUP_DONE") == "1"
+_startup_lock = threading.Lock()
+
+def _claim_import():
+    """Khóa file cạnh DB để chỉ một tiến trình import (ví dụ khi uvicorn --workers N gọi startup()
+    ở mọi worker). Trả về file đang giữ khóa, hoặc None nếu tiến trình khác đang import.
+    Khóa tự nhả khi tiến trình thoát."""
+    lock_file = open(f"{DB_FILE}.import.lock", "w")
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def _import_progress(stat):
+    """Trạng thái lần nhập trước nếu file import không đổi (cùng mtime, kích thước), ngược lại None."""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            "SELECT status, records_done, file_mtime_ns, file_size FROM import_status WHERE source = ?",
+            (IMPORT_FILE,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None or row["file_mtime_ns"] != stat.st_mtime_ns or row["file_size"] != stat.st_size:
+        return None
+    return row
+
+def _run_import(lock_file, start):
+    try:
+        import_data_from_json(start)
+    except Exception as e:
+        print(f"⚠️ Import {IMPORT_FILE} thất bại: {e}")
+    finally:
+        lock_file.close()
+
+def startup():
+    global _startup_done
+    lock_file = None
+    with _startup_lock:
+        if _startup_done:
+            return
+        init_db()
+        if os.path.exists(IMPORT_FILE):
+            lock_file = _claim_import()
+        start = 0
+        if lock_file is not None:
+            # attendance không có khóa duy nhất nên nhập lại phần đã commit sẽ nhân đôi dữ liệu:
+            # file không đổi thì bỏ qua nếu đã xong, hoặc nhập tiếp từ records_done (lần trước lỗi/dừng giữa chừng)
+            stat = os.stat(IMPORT_FILE)
+            progress = _import_progress(stat)
+            if progress is not None and progress["status"] == "done":
+                lock_file.close()
+                lock_file = None
+            elif progress is not None:
+                start = progress["records_done"] or 0
+        if lock_file is not None:
+            # Ghi trạng thái chờ trước khi trả về để readiness báo đúng ngay từ request đầu
+            writer.execute(lambda conn: _set_import_status(
+                conn, status="pending", records_total=None, records_done=start,
+                started_at=None, finished_at=None, error=None,
+                file_mtime_ns=stat.st_mtime_ns, file_size=stat.st_size
+            ))
+        _startup_done = True
+    if lock_file is not None:
+        threading.Thread(target=_run_import, args=(lock_file, start), name="attendance-import", daemon=True).start()
+
+_startup_thread = None
+_startup_thread_lock = threading.Lock()
+_startup_error = None
+
+def _startup_in_background():
+    """Cho readiness: chạy startup() ở thread nền (một lần), để probe chỉ gọi /api/v1/ready
+    vẫn khởi động được app khi chạy trực tiếp dưới server WSGI."""
+    global _startup_thread
+    
+    def run():
+        global _startup_error
+        try:
+            startup()
+            _startup_error = None
+        except Exception as e:
+            _startup_error = str(e)
+    
+    with _startup_thread_lock:
+        if _startup_done or (_startup_thread is not None and _startup_thread.is_alive()):
+            return
+        _startup_thread = threading.Thread(target=run, name="attendance-startup", daemon=True)
+        _startup_thread.start()
+
+@app.before_request
+def ensure_startup():
+    # Dự phòng khi app được chạy mà không qua startup(); readiness trả lời ngay cả khi đang khởi động
+    if not _startup_done and request.endpoint != "readiness":
+        startup()
+
+@app.route("/api/v1/ready", methods=["GET"])
+@db_handler
+def readiness():
+    """Sẵn sàng nhận request khi schema đã ở phiên bản hiện tại; import nền (nếu có) được
+    báo kèm tiến độ nhưng không chặn readiness."""
+    if not _startup_done:
+        _startup_in_background()
+        return jsonify({"ready": False, "status": "starting", "error": _startup_error}), 503
+    
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM import_status WHERE source = ?", (IMPORT_FILE,)).fetchone()
+    conn.close()
+    
+    result = {"ready": True, "status": "ready", "schema_version": SCHEMA_VERSION, "import": None}
+    if row:
+        progress = dict(row)
+        total = progress["records_total"]
+        progress["percent"] = round(100 * (progress["records_done"] or 0) / total, 1) if total else None
+        result["import"] = progress
+        if progress["status"] in ("pending", "running"):
+            result["status"] = "importing"
+    return jsonify(result)
 
 if __name__ == "__main__":
     # Khởi tạo DB trước khi chạy server
-    init_db()
-    import_data_from_json()
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    startup()
+    app.run(host="0.0.0.0", port=5000, debug=os.environ.get("FLASK_DEBUG") == "1")
@@ -0,0 +1,23 @@
+import importlib.util
+import os
+import sys
+
+# attendance-api.py có dấu '-' trong tên nên không import trực tiếp được.
+# Module này nạp nó một lần và cho phép dùng "attendance_app:app" với các server WSGI/ASGI.
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULE_NAME = "attendance_api"
+
+
+def load():
+    module = sys.modules.get(MODULE_NAME)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(MODULE_NAME, os.path.join(ROOT_DIR, "attendance-api.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[MODULE_NAME] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+attendance_api = load()
+app = attendance_api.app
@@ -0,0 +1,171 @@
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from attendance_app import attendance_api
+
+# Chế độ chạy production cho attendance API: server ASGI (uvicorn) nhiều worker.
+# Các route Flask được giữ nguyên và chạy trong một thread pool có giới hạn, nên mọi lời gọi
+# SQLite (blocking) không chặn event loop; nâng cấp schema chạy ở bước startup, import dữ liệu
+# chạy nền (tiến độ xem tại /api/v1/ready).
+#
+#   python attendance_asgi.py                         # 1 worker, cổng 5000
+#   WEB_CONCURRENCY=4 DB_THREADS=16 python attendance_asgi.py
+#
+# Mặc định một worker vì một phần trạng thái nằm trong bộ nhớ của từng tiến trình:
+#   - bộ ghi gom lô (write_queue): mỗi worker có bộ ghi riêng; SQLite vẫn tuần tự hóa các lệnh
+#     ghi giữa các worker nhưng việc gom lô chỉ có tác dụng trong từng worker
+#   - bộ phát hiện bất thường và cache personId (anomalies): RecordID gửi lại tới worker khác
+#     không bị phát hiện là trùng
+#   - số liệu /metrics: mỗi request chỉ thấy số liệu của worker trả lời
+# Job báo cáo (trạng thái trong SQLite, kết quả trong file) và tiến độ import thì dùng chung.
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "5000"))
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+DB_THREADS = int(os.environ.get("DB_THREADS", min(32, (os.cpu_count() or 1) + 4)))
+# Response nhỏ hơn ngưỡng này được gửi một lần; lớn hơn thì gửi dần từng phần cỡ này
+STREAM_CHUNK_BYTES = 64 * 1024
+
+executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="attendance-db")
+
+
+class WSGIBridge:
+    """Chạy một ứng dụng WSGI (Flask) trong thread pool cho trước, phục vụ qua ASGI.
+
+    Body request được đọc hết trước khi gọi app. Response nhỏ (các route JSON) được gom lại
+    rồi gửi một lần; response lớn (ví dụ send_file kết quả báo cáo) được gửi dần từ thread
+    đang chạy app, mỗi lần tối đa khoảng STREAM_CHUNK_BYTES và chờ client nhận xong mới đọc
+    tiếp, nên không giữ cả file trong bộ nhớ. Thread đó bận cho tới khi gửi xong.
+    """
+
+    def __init__(self, wsgi_app, pool):
+        self.wsgi_app = wsgi_app
+        self.pool = pool
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        environ = self._build_environ(scope, b"".join(body))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.pool, self._run, environ, loop, send)
+
+    def _run(self, environ, loop, send):
+        response = {}
+        buffered = []
+        state = {"size": 0, "started": False}
+
+        def send_message(message):
+            # Gửi trên event loop và chờ xong: tạo backpressure cho thread đọc response
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def flush(more_body):
+            if not state["started"]:
+                send_message({"type": "http.response.start", "status": response["status"],
+                              "headers": response["headers"]})
+                state["started"] = True
+            send_message({"type": "http.response.body", "body": b"".join(buffered), "more_body": more_body})
+            buffered.clear()
+            state["size"] = 0
+
+        def write(chunk):
+            if chunk:
+                buffered.append(chunk)
+                state["size"] += len(chunk)
+                if state["size"] >= STREAM_CHUNK_BYTES:
+                    flush(more_body=True)
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers
+            ]
+            return write
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                write(chunk)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        flush(more_body=False)
+
+    @staticmethod
+    def _build_environ(scope, body):
+        root_path = scope.get("root_path", "")
+        path = scope["path"]
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+            "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin-1")
+            value = value.decode("latin-1")
+            if name == "content-type":
+                environ["CONTENT_TYPE"] = value
+                continue
+            if name == "content-length":
+                continue
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Nâng cấp schema trước khi nhận request đầu tiên; import dữ liệu chạy nền
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(executor, attendance_api.startup)
+    yield
+    executor.shutdown(wait=False)
+
+
+app = FastAPI(title="Attendance API", lifespan=lifespan)
+app.mount("/", WSGIBridge(attendance_api.app, executor))
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Chạy startup một lần ở tiến trình cha; các worker kế thừa biến môi trường và bỏ qua
+    attendance_api.startup()
+    os.environ["ATTENDANCE_STARTUP_DONE"] = "1"
+    # report_jobs chia số tiến trình tạo báo cáo theo số worker
+    os.environ["WEB_CONCURRENCY"] = str(WEB_CONCURRENCY)
+    uvicorn.run(
+        "attendance_asgi:app", host=HOST, port=PORT, workers=WEB_CONCURRENCY,
+        app_dir=os.path.dirname(os.path.abspath(__file__))
+    )
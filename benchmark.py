@@ -0,0 +1,321 @@
+import argparse
+import datetime
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import lookups
+import shift_engine
+import synthetic_data
+
+# Bộ benchmark cho attendance API: sinh dữ liệu giả lập, đo các hàm chính qua Flask test client
+# và (tùy chọn) tải HTTP thật vào server đang chạy. Mỗi lần chạy ghi thêm một dòng JSON
+# vào file kết quả để so sánh giữa các commit.
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = "bench_results.jsonl"
+
+
+def load_app_module():
+    """Nạp attendance-api.py qua attendance_app (tên file có dấu '-')."""
+    import attendance_app
+    return attendance_app.attendance_api
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # nearest-rank
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, total_seconds, errors=0):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "count": count,
+        "errors": errors,
+        "total_s": round(total_seconds, 4),
+        "mean_ms": round(sum(latencies) / count * 1000, 3) if count else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if count else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3) if count else None,
+        "throughput_per_s": round(count / total_seconds, 1) if total_seconds else None
+    }
+
+
+def timed(fn, repeats=1):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - started
+
+
+def bench_import(app_module, workdir, rows, seed):
+    """import_data_from_json trên file all_recpush_sorted_by_idcard.json giả lập."""
+    employee_count, days = synthetic_data.scale(rows)
+    employees = synthetic_data.generate_employees(employee_count, seed)
+    devices = synthetic_data.generate_devices(5)
+    events = itertools.islice(synthetic_data.iter_recpush_events(employees, devices, days=days, seed=seed), rows)
+    synthetic_data.write_import_file(os.path.join(workdir, "all_recpush_sorted_by_idcard.json"), events)
+
+    app_module.DB_FILE = os.path.join(workdir, "import.db")
+    lookups.invalidate_caches()
+    app_module.init_db()
+    latencies, total = timed(app_module.import_data_from_json)
+    os.remove(os.path.join(workdir, "all_recpush_sorted_by_idcard.json"))
+    result = summarize(latencies, total)
+    result["rows"] = rows
+    result["rows_per_s"] = round(rows / total, 1) if total else None
+    return result
+
+
+# Chạy trong tiến trình mới: đo thời gian import module, startup(), request đầu tiên và
+# thời điểm import nền hoàn tất. argv: thư mục code, thời điểm (time.time()) tiến trình cha spawn.
+COLD_START_SCRIPT = """
+import json, sys, time
+spawned_at = float(sys.argv[2])
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import attendance_app
+t1 = time.perf_counter()
+attendance_app.attendance_api.startup()
+t2 = time.perf_counter()
+client = attendance_app.app.test_client()
+status = client.get("/api/v1/employees").status_code
+t3 = time.perf_counter()
+first_request_at = time.time()
+while True:
+    ready = client.get("/api/v1/ready").get_json()
+    if not ready["import"] or ready["import"]["status"] not in ("pending", "running"):
+        break
+    time.sleep(0.01)
+print(json.dumps({
+    "interpreter_s": round(time.time() - spawned_at - (time.perf_counter() - t0), 4),
+    "import_module_s": round(t1 - t0, 4),
+    "startup_s": round(t2 - t1, 4),
+    "first_request_s": round(t3 - t2, 4),
+    "time_to_first_request_s": round(first_request_at - spawned_at, 4),
+    "import_done_s": round(time.perf_counter() - t1, 4),
+    "first_request_status": status,
+    "import_status": ready["import"] and ready["import"]["status"]
+}))
+"""
+
+
+def bench_cold_start(workdir, import_rows, seed):
+    """Khởi động lạnh trong tiến trình mới: lần đầu (DB trống, có file import) và lần sau
+    (schema đã ở phiên bản hiện tại, không có file import)."""
+    directory = os.path.join(workdir, "cold_start")
+    os.makedirs(directory)
+    employee_count, days = synthetic_data.scale(import_rows)
+    employees = synthetic_data.generate_employees(employee_count, seed)
+    devices = synthetic_data.generate_devices(5)
+    events = itertools.islice(synthetic_data.iter_recpush_events(employees, devices, days=days, seed=seed), import_rows)
+    import_file = os.path.join(directory, "all_recpush_sorted_by_idcard.json")
+    synthetic_data.write_import_file(import_file, events)
+
+    def run_once():
+        output = subprocess.check_output(
+            [sys.executable, "-c", COLD_START_SCRIPT, ROOT_DIR, repr(time.time())], cwd=directory
+        )
+        return json.loads(output.decode().strip().splitlines()[-1])
+
+    result = {"fresh_db": run_once()}
+    os.remove(import_file)
+    result["existing_db"] = run_once()
+    result["import_rows"] = import_rows
+    return result
+
+
+def prepare_db(app_module, workdir, rows, seed):
+    app_module.DB_FILE = os.path.join(workdir, "attendance.db")
+    lookups.invalidate_caches()
+    app_module.init_db()
+
+    employee_count, days = synthetic_data.scale(rows)
+    employees = synthetic_data.generate_employees(employee_count, seed)
+    devices = synthetic_data.generate_devices(5)
+    events = itertools.islice(synthetic_data.iter_recpush_events(employees, devices, days=days, seed=seed), rows)
+
+    conn = sqlite3.connect(app_module.DB_FILE)
+    started = time.perf_counter()
+    synthetic_data.populate_db(conn, employees, devices, events)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return employees, devices, days, elapsed
+
+
+def bench_process_mqtt(client, employees, devices, count, seed):
+    """POST /api/v1/mqtt/process với các sự kiện mới (ngày sau dữ liệu đã nạp)."""
+    events = itertools.islice(
+        synthetic_data.iter_recpush_events(employees, devices, start_date="2030-01-01", days=10 ** 6, seed=seed + 1),
+        count
+    )
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for event in events:
+        t0 = time.perf_counter()
+        response = client.post("/api/v1/mqtt/process", json=event)
+        latencies.append(time.perf_counter() - t0)
+        if response.status_code != 201:
+            errors += 1
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def bench_report(client, start_date, end_date, repeats, department=None):
+    url = f"/api/v1/attendance/report?start_date={start_date}&end_date={end_date}"
+    if department:
+        url += f"&department={urllib.request.quote(department)}"
+    errors = 0
+
+    def call():
+        nonlocal errors
+        if client.get(url).status_code != 200:
+            errors += 1
+
+    latencies, total = timed(call, repeats)
+    return summarize(latencies, total, errors)
+
+
+def http_load(base_url, paths, requests_count, concurrency, timeout=30):
+    """Tải HTTP thật: gửi requests_count GET xoay vòng qua paths với concurrency luồng."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def call(i):
+        nonlocal errors
+        url = base_url.rstrip("/") + paths[i % len(paths)]
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                response.read()
+                ok = response.status == 200
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - t0
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(requests_count)))
+    result = summarize(latencies, time.perf_counter() - started, errors)
+    result["concurrency"] = concurrency
+    result["paths"] = paths
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    results = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "label": args.label,
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "scale": {"rows": args.rows, "import_rows": args.import_rows, "seed": args.seed},
+        "benchmarks": {}
+    }
+    benchmarks = results["benchmarks"]
+
+    workdir = tempfile.mkdtemp(prefix="attendance_bench_")
+    cwd = os.getcwd()
+    try:
+        # import_data_from_json đọc file theo đường dẫn tương đối
+        os.chdir(workdir)
+        app_module = load_app_module()
+        client = app_module.app.test_client()
+
+        print("⏱  import_data_from_json ...")
+        benchmarks["import_data_from_json"] = bench_import(app_module, workdir, args.import_rows, args.seed)
+
+        print("⏱  cold start ...")
+        benchmarks["cold_start"] = bench_cold_start(workdir, args.import_rows, args.seed)
+
+        print(f"⏱  Nạp {args.rows} bản ghi giả lập ...")
+        employees, devices, days, load_seconds = prepare_db(app_module, workdir, args.rows, args.seed)
+        results["scale"].update({"employees": len(employees), "days": days, "populate_s": round(load_seconds, 3)})
+
+        print("⏱  process_mqtt_data ...")
+        benchmarks["process_mqtt_data"] = bench_process_mqtt(client, employees, devices, args.mqtt_events, args.seed)
+
+        start_date = "2025-01-01"
+        end_date = (datetime.date(2025, 1, 1) + datetime.timedelta(days=days - 1)).isoformat()
+        month_end = min(end_date, "2025-01-31")
+        print("⏱  get_attendance_report ...")
+        benchmarks["get_attendance_report_month"] = bench_report(client, start_date, month_end, args.report_repeats)
+        benchmarks["get_attendance_report_full"] = bench_report(client, start_date, end_date, args.report_repeats)
+        benchmarks["get_attendance_report_department"] = bench_report(
+            client, start_date, end_date, args.report_repeats, synthetic_data.DEPARTMENTS[0]
+        )
+
+        print("⏱  shift_engine ...")
+        benchmarks["shift_engine"] = shift_engine.benchmark(min(len(employees), 5000), min(days, 365))
+
+        if args.url:
+            print(f"⏱  HTTP load {args.url} ...")
+            paths = args.paths or [
+                "/api/v1/attendance?page=1&per_page=50",
+                "/api/v1/employees",
+                f"/api/v1/attendance/date/{start_date}?per_page=50"
+            ]
+            benchmarks["http_load"] = http_load(args.url, paths, args.requests, args.concurrency)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.results, "a", encoding="utf-8") as f:
+        f.write(json.dumps(results, ensure_ascii=False) + "\n")
+
+    print(json.dumps(results, indent=4, ensure_ascii=False))
+    print(f"✅ Đã ghi kết quả vào {args.results}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark attendance API")
+    parser.add_argument("--rows", type=int, default=10000, help="số bản ghi chấm công trong DB benchmark")
+    parser.add_argument("--import-rows", type=int, default=10000, help="số bản ghi cho benchmark import_data_from_json")
+    parser.add_argument("--mqtt-events", type=int, default=1000)
+    parser.add_argument("--report-repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--label", default=None, help="nhãn để phân biệt các lần chạy")
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--url", default=None, help="URL server đang chạy để đo tải HTTP, ví dụ http://127.0.0.1:5000")
+    parser.add_argument("--paths", nargs="*", default=None)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args(argv)
+    args.results = os.path.abspath(args.results)
+    run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
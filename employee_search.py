@@ -0,0 +1,124 @@
+import re
+import sqlite3
+import unicodedata
+
+# Chỉ mục tìm kiếm nhân viên (FTS5) theo tên, id_card, person_id, phòng ban.
+# Bảng employees_fts được đồng bộ bằng trigger trên employees, nên mọi đường ghi
+# (add_employee, update_employee, upsert hàng loạt, script nạp dữ liệu) đều tự cập nhật chỉ mục.
+#
+# Bỏ dấu: tokenizer unicode61 remove_diacritics xử lý các dấu thanh/mũ ("Nguyễn" -> "nguyen"),
+# còn "đ" là chữ riêng nên được thay bằng "d" trước khi đưa vào chỉ mục và trong câu tìm kiếm.
+
+FTS_TABLE = "employees_fts"
+INDEXED_COLUMNS = ("name", "id_card", "person_id", "department")
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Biểu thức SQL thay "đ"/"Đ" bằng "d"/"D" cho một cột của employees
+_fold_sql = "replace(replace(coalesce({0}, ''), 'đ', 'd'), 'Đ', 'D')"
+_token = re.compile(r"\w+")
+
+
+def fold(text):
+    """Bỏ dấu tiếng Việt và chuyển về chữ thường: "Đức" -> "duc"."""
+    text = str(text).replace("đ", "d").replace("Đ", "D")
+    text = unicodedata.normalize("NFD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def create_search_index(conn):
+    """Tạo bảng FTS5 và trigger đồng bộ; lần đầu tạo thì nạp toàn bộ employees hiện có.
+
+    Trả về False nếu SQLite không có FTS5 (khi đó search() dùng LIKE thay thế).
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone()
+    if not exists:
+        try:
+            # prefix='1 2 3': chỉ mục tiền tố để typeahead với 1-3 ký tự đầu không phải quét toàn bộ term
+            conn.execute(f"""
+            CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+                {', '.join(INDEXED_COLUMNS)},
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '1 2 3'
+            )
+            """)
+        except sqlite3.OperationalError as e:
+            if "fts5" not in str(e):
+                raise
+            print(f"⚠️ SQLite không hỗ trợ FTS5, tìm kiếm nhân viên dùng LIKE: {e}")
+            return False
+        conn.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(INDEXED_COLUMNS)}) "
+            f"SELECT id, {', '.join(_fold_sql.format(c) for c in INDEXED_COLUMNS)} FROM employees"
+        )
+
+    new_values = ", ".join(_fold_sql.format(f"new.{c}") for c in INDEXED_COLUMNS)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS employees_fts_insert AFTER INSERT ON employees BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, {', '.join(INDEXED_COLUMNS)}) VALUES (new.id, {new_values});
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS employees_fts_update AFTER UPDATE OF id, {', '.join(INDEXED_COLUMNS)} ON employees BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE} (rowid, {', '.join(INDEXED_COLUMNS)}) VALUES (new.id, {new_values});
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS employees_fts_delete AFTER DELETE ON employees BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """)
+    return True
+
+
+def match_expression(query):
+    """Chuyển chuỗi người dùng nhập thành biểu thức MATCH: mọi từ đều phải khớp,
+    từ cuối cùng khớp theo tiền tố (đang gõ dở). Trả về None nếu không có từ nào."""
+    tokens = _token.findall(fold(query))
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def has_index(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone() is not None
+
+
+def search(conn, query, limit=DEFAULT_LIMIT, include_inactive=False):
+    """Tìm nhân viên cho ô typeahead, sắp theo độ liên quan (khớp tên được ưu tiên)."""
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    active_filter = "" if include_inactive else "AND e.active = 1"
+
+    if has_index(conn):
+        # bm25: trọng số cột theo thứ tự name, id_card, person_id, department
+        cursor = conn.execute(
+            f"""
+            SELECT e.* FROM {FTS_TABLE} f
+            JOIN employees e ON e.id = f.rowid
+            WHERE {FTS_TABLE} MATCH ? {active_filter}
+            ORDER BY bm25({FTS_TABLE}, 10.0, 5.0, 5.0, 1.0), e.name
+            LIMIT ?
+            """,
+            (expression, limit)
+        )
+    else:
+        prefix = query.strip() + "%"
+        cursor = conn.execute(
+            f"""
+            SELECT e.* FROM employees e
+            WHERE (e.name LIKE ? OR e.person_id LIKE ? OR CAST(e.id_card AS TEXT) LIKE ?) {active_filter}
+            ORDER BY e.name
+            LIMIT ?
+            """,
+            (prefix, prefix, prefix, limit)
+        )
+    return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,244 @@
+import os
+import threading
+import time
+
+# Các bảng tra cứu mã hóa dạng số nguyên cho những cột lặp lại nhiều trong attendance.
+# Mỗi bảng chỉ có (id, name); attendance chỉ lưu id.
+LOOKUP_TABLES = {
+    "direction": "directions",
+    "verify_status": "verify_statuses",
+    "device_name": "device_names",
+    "open_door_way": "open_door_ways",
+    "push_type": "push_types",
+}
+
+
+def create_lookup_tables(cursor):
+    for table in LOOKUP_TABLES.values():
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL
+        )
+        ''')
+
+
+class LookupCache:
+    """Bộ nhớ đệm trong tiến trình ánh xạ giá trị chuỗi <-> mã số nguyên của một bảng tra cứu.
+
+    Mã hóa (encode) dùng ở luồng ghi, giải mã (decode) dùng ở luồng đọc. Khi không có
+    trong cache thì truy vấn/ghi vào bảng qua connection của người gọi, nên giá trị mới
+    nằm cùng transaction với bản ghi chấm công.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self._codes = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, code, name):
+        with self._lock:
+            self._codes[name] = code
+            self._names[code] = name
+
+    def encode(self, conn, name):
+        if name is None:
+            return None
+        code = self._codes.get(name)
+        if code is not None:
+            return code
+        conn.execute(f"INSERT OR IGNORE INTO {self.table} (name) VALUES (?)", (name,))
+        code = conn.execute(f"SELECT id FROM {self.table} WHERE name = ?", (name,)).fetchone()[0]
+        self._remember(code, name)
+        return code
+
+    def decode(self, conn, code):
+        if code is None:
+            return None
+        name = self._names.get(code)
+        if name is not None:
+            return name
+        row = conn.execute(f"SELECT name FROM {self.table} WHERE id = ?", (code,)).fetchone()
+        if row is None:
+            return None
+        self._remember(code, row[0])
+        return row[0]
+
+    def invalidate(self):
+        with self._lock:
+            self._codes.clear()
+            self._names.clear()
+
+
+# last_active của thiết bị được cập nhật tối đa một lần trong khoảng này
+DEVICE_TOUCH_SECONDS = float(os.environ.get("DEVICE_TOUCH_SECONDS", "60"))
+
+
+class DeviceRegistry:
+    """Bảng devices: chỉ gồm thiết bị phần cứng có deviceID, như schema cũ.
+
+    Tên thiết bị trên từng bản ghi chấm công nằm ở bảng tra cứu device_names, nên đổi tên
+    thiết bị không làm đổi tên ở các bản ghi cũ. Cache deviceID -> (tên, lần ghi cuối) để
+    chỉ ghi DB khi thiết bị mới, đổi tên, hoặc last_active đã cũ hơn DEVICE_TOUCH_SECONDS.
+    """
+
+    def __init__(self, touch_seconds=DEVICE_TOUCH_SECONDS):
+        self.touch_seconds = touch_seconds
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def touch(self, conn, device_id, name):
+        name = name or "Unknown Device"
+        seen = self._seen.get(device_id)
+        now = time.monotonic()
+        if seen is not None and seen[0] == name and now - seen[1] < self.touch_seconds:
+            return
+        conn.execute(
+            """
+            INSERT INTO devices (device_id, name, status, last_active)
+            VALUES (?, ?, 'active', datetime('now'))
+            ON CONFLICT(device_id) DO UPDATE SET
+                name = excluded.name, status = 'active', last_active = excluded.last_active
+            """,
+            (device_id, name)
+        )
+        with self._lock:
+            self._seen[device_id] = (name, now)
+
+    def invalidate(self):
+        with self._lock:
+            self._seen.clear()
+
+
+# Cache dùng chung cho toàn tiến trình
+caches = {column: LookupCache(table) for column, table in LOOKUP_TABLES.items()}
+devices = DeviceRegistry()
+
+# Cột mã trong attendance tương ứng với từng trường chuỗi trả về trong JSON
+CODE_COLUMNS = {
+    "direction": "direction_id",
+    "verify_status": "verify_status_id",
+    "device_name": "device_name_id",
+    "open_door_way": "open_door_way_id",
+    "push_type": "push_type_id",
+}
+
+
+def invalidate_caches():
+    for cache in caches.values():
+        cache.invalidate()
+    devices.invalidate()
+
+
+def encode_values(conn, values, device_id=None):
+    """Chuyển dict {direction, verify_status, device_name, open_door_way, push_type}
+    thành dict {direction_id, ...} để ghi vào attendance. Nếu có deviceID phần cứng thì
+    ghi nhận thiết bị vào bảng devices."""
+    if device_id:
+        devices.touch(conn, device_id, values.get("device_name"))
+    return {column: caches[field].encode(conn, values.get(field)) for field, column in CODE_COLUMNS.items()}
+
+
+def decode_row(conn, row):
+    """Chuyển một dòng attendance (dict hoặc sqlite3.Row) có các cột *_id thành dict
+    với các trường chuỗi như schema cũ, để JSON trả về không thay đổi."""
+    record = dict(row)
+    for field, column in CODE_COLUMNS.items():
+        if column in record:
+            record[field] = caches[field].decode(conn, record.pop(column))
+    return record
+
+
+def decode_rows(conn, rows):
+    return [decode_row(conn, row) for row in rows]
+
+
+def create_attendance_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id INTEGER,
+        person_id TEXT,
+        record_id TEXT,
+        timestamp TEXT,
+        direction_id INTEGER,
+        verify_status_id INTEGER,
+        device_name_id INTEGER,
+        open_door_way_id INTEGER,
+        push_type_id INTEGER,
+        raw_data TEXT,
+        FOREIGN KEY (employee_id) REFERENCES employees (id),
+        FOREIGN KEY (direction_id) REFERENCES directions (id),
+        FOREIGN KEY (verify_status_id) REFERENCES verify_statuses (id),
+        FOREIGN KEY (device_name_id) REFERENCES device_names (id),
+        FOREIGN KEY (open_door_way_id) REFERENCES open_door_ways (id),
+        FOREIGN KEY (push_type_id) REFERENCES push_types (id)
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_employee_time ON attendance (employee_id, timestamp)")
+
+
+def migrate_attendance_table(conn):
+    """Chuyển bảng attendance kiểu cũ (cột chuỗi) sang dạng mã hóa nếu cần."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(attendance)")]
+    if "direction" not in columns:
+        return False
+
+    conn.execute("ALTER TABLE attendance RENAME TO attendance_old")
+    conn.execute("DROP INDEX IF EXISTS idx_attendance_employee_time")
+    create_attendance_table(conn)
+    for field in CODE_COLUMNS:
+        conn.execute(f"""
+        INSERT OR IGNORE INTO {LOOKUP_TABLES[field]} (name)
+        SELECT DISTINCT {field} FROM attendance_old WHERE {field} IS NOT NULL
+        """)
+    conn.execute("""
+    INSERT INTO attendance
+    (id, employee_id, person_id, record_id, timestamp, direction_id, verify_status_id,
+     device_name_id, open_door_way_id, push_type_id, raw_data)
+    SELECT
+        o.id, o.employee_id, o.person_id, o.record_id, o.timestamp,
+        (SELECT id FROM directions WHERE name = o.direction),
+        (SELECT id FROM verify_statuses WHERE name = o.verify_status),
+        (SELECT id FROM device_names WHERE name = o.device_name),
+        (SELECT id FROM open_door_ways WHERE name = o.open_door_way),
+        (SELECT id FROM push_types WHERE name = o.push_type),
+        o.raw_data
+    FROM attendance_old o
+    """)
+    conn.execute("DROP TABLE attendance_old")
+    invalidate_caches()
+    return True
+
+
+def migrate_device_names(conn):
+    """Chuyển attendance.device_id (trỏ tới devices, kể cả các dòng chỉ có tên) sang
+    device_name_id trỏ tới bảng tra cứu device_names, và xóa các dòng devices không có deviceID."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(attendance)")]
+    if "device_id" not in columns:
+        return False
+
+    create_lookup_tables(conn.cursor())
+    conn.execute("""
+    INSERT OR IGNORE INTO device_names (name)
+    SELECT DISTINCT d.name FROM devices d
+    WHERE d.name IS NOT NULL AND d.id IN (SELECT DISTINCT device_id FROM attendance)
+    """)
+    conn.execute("ALTER TABLE attendance RENAME TO attendance_old")
+    conn.execute("DROP INDEX IF EXISTS idx_attendance_employee_time")
+    create_attendance_table(conn)
+    conn.execute("""
+    INSERT INTO attendance
+    (id, employee_id, person_id, record_id, timestamp, direction_id, verify_status_id,
+     device_name_id, open_door_way_id, push_type_id, raw_data)
+    SELECT
+        o.id, o.employee_id, o.person_id, o.record_id, o.timestamp, o.direction_id, o.verify_status_id,
+        (SELECT n.id FROM devices d JOIN device_names n ON n.name = d.name WHERE d.id = o.device_id),
+        o.open_door_way_id, o.push_type_id, o.raw_data
+    FROM attendance_old o
+    """)
+    conn.execute("DROP TABLE attendance_old")
+    conn.execute("DELETE FROM devices WHERE device_id IS NULL")
+    invalidate_caches()
+    return True
@@ -0,0 +1,274 @@
+import bisect
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Thu thập số liệu hiệu năng (latency theo route, thời gian/số dòng theo câu query, connection)
+# và xuất ra định dạng text của Prometheus. Bật bằng biến môi trường METRICS_ENABLED=1;
+# khi tắt, db_handler và get_db_connection đi thẳng như cũ.
+
+ENABLED = os.environ.get("METRICS_ENABLED", "0").lower() in ("1", "true", "yes")
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_MS", "200")) / 1000
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+logger = logging.getLogger("attendance_metrics")
+
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+_route_latency = {}
+_route_requests = {}
+_query_latency = {}
+_query_rows = {}
+_query_fetch_seconds = {}
+_counters = {
+    "connections_opened": 0,
+    "connections_open": 0,
+    "requests_in_flight": 0,
+    "slow_queries": 0
+}
+# Hàm trả về số liệu bổ sung {(tên, ((nhãn, giá trị), ...)): số}, ví dụ trạng thái hàng đợi job báo cáo,
+# kèm tập tên metric là counter (tăng dần); các tên còn lại xuất dạng gauge
+_providers = []
+
+
+def observe_request(route, method, status, seconds):
+    with _lock:
+        key = (route, method)
+        histogram = _route_latency.get(key)
+        if histogram is None:
+            histogram = _route_latency[key] = Histogram()
+        histogram.observe(seconds)
+        status_key = (route, method, str(status))
+        _route_requests[status_key] = _route_requests.get(status_key, 0) + 1
+
+
+def request_started():
+    with _lock:
+        _counters["requests_in_flight"] += 1
+
+
+def request_finished():
+    with _lock:
+        _counters["requests_in_flight"] -= 1
+
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    return _whitespace.sub(" ", sql).strip()[:200]
+
+
+def observe_query(sql, seconds):
+    key = normalize_sql(sql)
+    with _lock:
+        histogram = _query_latency.get(key)
+        if histogram is None:
+            histogram = _query_latency[key] = Histogram()
+        histogram.observe(seconds)
+    return key
+
+
+def add_query_rows(key, rows, seconds=0.0):
+    with _lock:
+        _query_rows[key] = _query_rows.get(key, 0) + rows
+        if seconds:
+            _query_fetch_seconds[key] = _query_fetch_seconds.get(key, 0.0) + seconds
+
+
+def register_provider(provider, counters=()):
+    _providers.append((provider, frozenset(counters)))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor ghi lại thời gian execute, số dòng đọc được và log câu query chậm."""
+
+    _query_key = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        self._query_key = observe_query(sql, elapsed)
+        if self.rowcount > 0:
+            add_query_rows(self._query_key, self.rowcount)
+        if elapsed >= SLOW_QUERY_SECONDS:
+            _log_slow_query(self.connection, sql, parameters, elapsed)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        elapsed = time.perf_counter() - started
+        self._query_key = observe_query(sql, elapsed)
+        if self.rowcount > 0:
+            add_query_rows(self._query_key, self.rowcount)
+        if elapsed >= SLOW_QUERY_SECONDS:
+            _log_slow_query(self.connection, sql, None, elapsed)
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        if self._query_key is not None:
+            add_query_rows(self._query_key, 0 if row is None else 1, time.perf_counter() - started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._query_key is not None:
+            add_query_rows(self._query_key, len(rows), time.perf_counter() - started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._query_key is not None:
+            add_query_rows(self._query_key, len(rows), time.perf_counter() - started)
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        if self._query_key is not None:
+            add_query_rows(self._query_key, 1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection đếm số connection mở và trả về InstrumentedCursor."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._closed = False
+        with _lock:
+            _counters["connections_opened"] += 1
+            _counters["connections_open"] += 1
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            with _lock:
+                _counters["connections_open"] -= 1
+        super().close()
+
+
+def _log_slow_query(conn, sql, parameters, elapsed):
+    with _lock:
+        _counters["slow_queries"] += 1
+    plan = []
+    if parameters is not None:
+        try:
+            # Dùng cursor gốc để EXPLAIN không bị tính vào số liệu
+            cursor = sqlite3.Cursor(conn)
+            plan = [row[-1] for row in cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)]
+        except sqlite3.Error as e:
+            plan = [f"EXPLAIN failed: {e}"]
+    logger.warning(
+        "Slow query (%.1f ms): %s\n  plan: %s",
+        elapsed * 1000, normalize_sql(sql), " | ".join(plan) if plan else "n/a"
+    )
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _render_histogram(lines, name, help_text, histograms, label_names):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in sorted(histograms.items()):
+        labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+
+
+def render():
+    """Xuất toàn bộ số liệu theo định dạng text của Prometheus."""
+    lines = []
+    with _lock:
+        _render_histogram(lines, "attendance_http_request_duration_seconds",
+                          "Request latency per route.", _route_latency, ("route", "method"))
+
+        lines.append("# HELP attendance_http_requests_total Requests per route and status code.")
+        lines.append("# TYPE attendance_http_requests_total counter")
+        for (route, method, status), count in sorted(_route_requests.items()):
+            lines.append(f"attendance_http_requests_total{_labels(route=route, method=method, status=status)} {count}")
+
+        lines.append("# HELP attendance_http_requests_in_flight Requests currently being handled.")
+        lines.append("# TYPE attendance_http_requests_in_flight gauge")
+        lines.append(f"attendance_http_requests_in_flight {_counters['requests_in_flight']}")
+
+        _render_histogram(lines, "attendance_db_query_duration_seconds",
+                          "Statement execute time per query.", _query_latency, ("query",))
+
+        lines.append("# HELP attendance_db_query_rows_total Rows read or written per query.")
+        lines.append("# TYPE attendance_db_query_rows_total counter")
+        for query, rows in sorted(_query_rows.items()):
+            lines.append(f"attendance_db_query_rows_total{_labels(query=query)} {rows}")
+
+        lines.append("# HELP attendance_db_query_fetch_seconds_total Time spent fetching rows per query.")
+        lines.append("# TYPE attendance_db_query_fetch_seconds_total counter")
+        for query, seconds in sorted(_query_fetch_seconds.items()):
+            lines.append(f"attendance_db_query_fetch_seconds_total{_labels(query=query)} {seconds}")
+
+        lines.append("# HELP attendance_db_slow_queries_total Queries slower than SLOW_QUERY_MS.")
+        lines.append("# TYPE attendance_db_slow_queries_total counter")
+        lines.append(f"attendance_db_slow_queries_total {_counters['slow_queries']}")
+
+        lines.append("# HELP attendance_db_connections_opened_total SQLite connections opened.")
+        lines.append("# TYPE attendance_db_connections_opened_total counter")
+        lines.append(f"attendance_db_connections_opened_total {_counters['connections_opened']}")
+
+        lines.append("# HELP attendance_db_connections_open SQLite connections currently open.")
+        lines.append("# TYPE attendance_db_connections_open gauge")
+        lines.append(f"attendance_db_connections_open {_counters['connections_open']}")
+
+    values_by_name = {}
+    types = {}
+    for provider, counters in _providers:
+        for (name, labels), value in provider().items():
+            values_by_name.setdefault(name, []).append((labels, value))
+            types[name] = "counter" if name in counters else "gauge"
+    for name, values in sorted(values_by_name.items()):
+        lines.append(f"# TYPE {name} {types[name]}")
+        for labels, value in values:
+            lines.append(f"{name}{_labels(**dict(labels)) if labels else ''} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -88,6 +88,9 @@ def on_message(client, userdata, msg):
             
             if response.status_code == 201:
                 logger.info(f"✅ Data sent to API successfully: {response.json()}")
+            elif response.status_code == 200:
+                # API đã nhận nhưng bỏ qua (RecordID trùng do thiết bị gửi lại hoặc chấm lặp nhanh)
+                logger.info(f"ℹ️ Duplicate punch ignored by API: {response.json()}")
             else:
                 logger.error(f"❌ Failed to send data to API: {response.status_code} - {response.text}")
                 
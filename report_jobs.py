@@ -0,0 +1,368 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import reports
+import shift_engine
+
+# Trạng thái job nằm trong bảng report_jobs và kết quả nằm trong file JSON cạnh file DB,
+# nên worker web nào cũng trả lời được khi client hỏi trạng thái/tải kết quả. Các phần đã
+# xong chỉ giữ trong bộ nhớ của tiến trình đã nhận job cho tới khi gộp.
+
+# Số tiến trình tạo báo cáo của mỗi worker web; mặc định chia đều số lõi CPU cho WEB_CONCURRENCY
+# worker để tổng số tiến trình không vượt quá số lõi
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+# Số phần (shard) trên mỗi tiến trình, để phần chậm không giữ cả job
+SHARDS_PER_WORKER = 4
+# Thời gian giữ kết quả job đã xong (giây)
+JOB_TTL_SECONDS = 3600
+# Tiến trình nhận job cập nhật heartbeat_at theo chu kỳ này khi job đang chạy; job "running" không
+# có heartbeat quá JOB_STALE_SECONDS (tiến trình đó đã dừng/crash, các phần đã xong bị mất) bị đánh dấu lỗi
+JOB_HEARTBEAT_SECONDS = 10
+JOB_STALE_SECONDS = 60
+# Thư mục chứa file kết quả, tương đối với thư mục của file DB
+RESULTS_DIR = "report_results"
+
+_executor = None
+_executor_lock = threading.Lock()
+# Các phần đã xong của job đang chạy trong tiến trình này: job_id -> list
+_partials = {}
+_partials_lock = threading.Lock()
+# Thread heartbeat theo file DB (benchmark có thể đổi DB_FILE)
+_heartbeat_threads = {}
+
+
+def create_job_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS report_jobs (
+        job_id TEXT PRIMARY KEY,
+        status TEXT,
+        params TEXT,
+        shards_total INTEGER,
+        shards_done INTEGER,
+        created_at REAL,
+        finished_at REAL,
+        error TEXT,
+        result_path TEXT,
+        heartbeat_at REAL
+    )
+    ''')
+
+
+def add_heartbeat_column(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(report_jobs)")]
+    if "heartbeat_at" not in columns:
+        conn.execute("ALTER TABLE report_jobs ADD COLUMN heartbeat_at REAL")
+
+
+def _connect(db_file):
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _update_job(db_file, job_id, **fields):
+    conn = _connect(db_file)
+    try:
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        conn.execute(f"UPDATE report_jobs SET {assignments} WHERE job_id = :job_id", dict(fields, job_id=job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _result_path(db_file, job_id):
+    directory = os.path.join(os.path.dirname(os.path.abspath(db_file)), RESULTS_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{job_id}.json")
+
+
+def _write_result(db_file, job_id, params, data):
+    """Ghi file kết quả (đúng nội dung trả về khi tải) rồi đổi tên một lần để không ai đọc file dở."""
+    path = _result_path(db_file, job_id)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "start_date": params["start_date"],
+            "end_date": params["end_date"],
+            "shift": params["shift"],
+            "data": data
+        }, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Dùng spawn để tiến trình con không thừa hưởng thread/connection của web server
+            _executor = ProcessPoolExecutor(
+                max_workers=REPORT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _run_shard(db_file, start_date, end_date, shift, shard):
+    """Chạy trong tiến trình con: tạo báo cáo cho một phần với connection chỉ đọc riêng."""
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        return reports.build_attendance_report(
+            conn, start_date, end_date,
+            department=shard.get("department"),
+            employee_id=shard.get("employee_id"),
+            shift=shift,
+            employee_id_range=shard.get("employee_id_range"),
+            no_department=shard.get("no_department", False)
+        )
+    finally:
+        conn.close()
+
+
+def plan_shards(conn, department=None, employee_id=None, shard_by="employee"):
+    """Chia tập nhân viên cần báo cáo thành các phần độc lập."""
+    query = "SELECT id, department FROM employees WHERE active = 1"
+    params = []
+    if department:
+        query += " AND department = ?"
+        params.append(department)
+    if employee_id:
+        query += " AND id = ?"
+        params.append(employee_id)
+    query += " ORDER BY id"
+    rows = conn.execute(query, params).fetchall()
+    if not rows:
+        return []
+
+    if shard_by == "department":
+        departments = sorted({row[1] for row in rows if row[1]})
+        shards = [{"department": d, "employee_id": employee_id} for d in departments]
+        if any(not row[1] for row in rows):
+            shards.append({"employee_id": employee_id, "no_department": True})
+        return shards
+
+    ids = [row[0] for row in rows]
+    shard_count = max(1, min(len(ids), REPORT_WORKERS * SHARDS_PER_WORKER))
+    size = -(-len(ids) // shard_count)
+    return [
+        {
+            "department": department,
+            "employee_id": employee_id,
+            "employee_id_range": (ids[i], ids[min(i + size, len(ids)) - 1])
+        }
+        for i in range(0, len(ids), size)
+    ]
+
+
+def _fail_stale_jobs(conn, job_id=None):
+    """Đánh dấu lỗi các job "running" mà tiến trình nhận job đã ngừng gửi heartbeat."""
+    now = time.time()
+    query = (
+        "UPDATE report_jobs SET status = 'failed', finished_at = ?, "
+        "error = 'Report worker stopped before the job finished' "
+        "WHERE status = 'running' AND COALESCE(heartbeat_at, created_at) < ?"
+    )
+    params = [now, now - JOB_STALE_SECONDS]
+    if job_id is not None:
+        query += " AND job_id = ?"
+        params.append(job_id)
+    conn.execute(query, params)
+
+
+def _heartbeat_loop(db_file):
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        with _partials_lock:
+            job_ids = list(_partials)
+        if not job_ids:
+            continue
+        try:
+            conn = _connect(db_file)
+            try:
+                conn.executemany(
+                    "UPDATE report_jobs SET heartbeat_at = ? WHERE job_id = ? AND status = 'running'",
+                    [(time.time(), job_id) for job_id in job_ids]
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Không cập nhật được heartbeat job báo cáo: {e}")
+
+
+def _start_heartbeat(db_file):
+    with _executor_lock:
+        if db_file not in _heartbeat_threads:
+            thread = threading.Thread(
+                target=_heartbeat_loop, args=(db_file,), name="report-job-heartbeat", daemon=True
+            )
+            thread.start()
+            _heartbeat_threads[db_file] = thread
+
+
+def _prune_jobs(db_file):
+    conn = _connect(db_file)
+    try:
+        _fail_stale_jobs(conn)
+        rows = conn.execute(
+            "SELECT job_id, result_path FROM report_jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+            (time.time() - JOB_TTL_SECONDS,)
+        ).fetchall()
+        for row in rows:
+            if row["result_path"]:
+                try:
+                    os.remove(row["result_path"])
+                except FileNotFoundError:
+                    pass
+        conn.executemany("DELETE FROM report_jobs WHERE job_id = ?", [(row["job_id"],) for row in rows])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def submit_report_job(db_file, start_date, end_date, department=None, employee_id=None,
+                      shift=shift_engine.DEFAULT_SHIFT, shard_by="employee"):
+    """Tạo job báo cáo chạy song song trên process pool, trả về job_id."""
+    _prune_jobs(db_file)
+
+    conn = _connect(db_file)
+    try:
+        shards = plan_shards(conn, department, employee_id, shard_by)
+    finally:
+        conn.close()
+
+    job_id = uuid.uuid4().hex
+    params = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "department": department,
+        "employee_id": employee_id,
+        "shift": shift,
+        "shard_by": shard_by
+    }
+    now = time.time()
+    result_path = None if shards else _write_result(db_file, job_id, params, [])
+
+    conn = _connect(db_file)
+    try:
+        conn.execute(
+            """
+            INSERT INTO report_jobs
+            (job_id, status, params, shards_total, shards_done, created_at, finished_at, error, result_path,
+             heartbeat_at)
+            VALUES (?, ?, ?, ?, 0, ?, ?, NULL, ?, ?)
+            """,
+            (job_id, "running" if shards else "done", json.dumps(params), len(shards),
+             now, None if shards else now, result_path, now)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    if shards:
+        with _partials_lock:
+            _partials[job_id] = []
+        _start_heartbeat(db_file)
+        executor = _get_executor()
+        for shard in shards:
+            future = executor.submit(_run_shard, db_file, start_date, end_date, shift, shard)
+            future.add_done_callback(
+                lambda f, job_id=job_id: _on_shard_done(db_file, job_id, params, len(shards), f)
+            )
+
+    return job_id
+
+
+def _on_shard_done(db_file, job_id, params, shards_total, future):
+    with _partials_lock:
+        partials = _partials.get(job_id)
+        if partials is None:
+            # Job đã lỗi ở phần khác
+            return
+        error = future.exception()
+        if error is None:
+            partials.append(future.result())
+            shards_done = len(partials)
+        else:
+            del _partials[job_id]
+        if error is None and shards_done == shards_total:
+            del _partials[job_id]
+
+    try:
+        if error is not None:
+            _update_job(db_file, job_id, status="failed", error=str(error), finished_at=time.time())
+        elif shards_done < shards_total:
+            _update_job(db_file, job_id, shards_done=shards_done, heartbeat_at=time.time())
+        else:
+            # Gộp kết quả các phần, giữ thứ tự theo id nhân viên như báo cáo thường
+            merged = [employee for partial in partials for employee in partial]
+            merged.sort(key=lambda employee: employee["employee_id"])
+            path = _write_result(db_file, job_id, params, merged)
+            _update_job(
+                db_file, job_id, status="done", shards_done=shards_done,
+                finished_at=time.time(), result_path=path
+            )
+    except Exception as e:
+        _update_job(db_file, job_id, status="failed", error=str(e), finished_at=time.time())
+
+
+def get_job(db_file, job_id):
+    conn = _connect(db_file)
+    try:
+        row = conn.execute("SELECT * FROM report_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is not None and row["status"] == "running" and \
+                (row["heartbeat_at"] or row["created_at"]) < time.time() - JOB_STALE_SECONDS:
+            _fail_stale_jobs(conn, job_id)
+            conn.commit()
+            row = conn.execute("SELECT * FROM report_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+def job_status(job):
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "params": job["params"],
+        "shards_total": job["shards_total"],
+        "shards_done": job["shards_done"],
+        "created_at": job["created_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"]
+    }
+
+
+def queue_stats(db_file):
+    """Số job theo trạng thái và số phần đang chờ/chạy, dùng cho /metrics."""
+    stats = {("attendance_report_jobs", (("status", status),)): 0 for status in ("running", "done", "failed")}
+    conn = _connect(db_file)
+    try:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) AS jobs, SUM(shards_total - shards_done) AS pending "
+            "FROM report_jobs GROUP BY status"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # DB chưa được khởi tạo
+        rows = []
+    finally:
+        conn.close()
+    pending_shards = 0
+    for row in rows:
+        stats[("attendance_report_jobs", (("status", row["status"]),))] = row["jobs"]
+        if row["status"] == "running":
+            pending_shards = row["pending"] or 0
+    stats[("attendance_report_shards_pending", ())] = pending_shards
+    return stats
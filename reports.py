@@ -0,0 +1,127 @@
+import datetime
+
+import lookups
+import shift_engine
+
+REPORT_QUERY = """
+SELECT e.id, e.name, e.id_card, e.department, e.position,
+       a.timestamp, CAST(strftime('%s', a.timestamp) AS INTEGER) AS ts, a.direction_id, a.device_name_id
+FROM employees e
+JOIN attendance a ON e.id = a.employee_id
+WHERE e.active = 1 AND a.timestamp >= ? AND a.timestamp < ?
+"""
+
+
+def default_date_range(start_date=None, end_date=None):
+    today = datetime.datetime.now()
+    if not start_date:
+        # Mặc định là đầu tháng hiện tại
+        start_date = datetime.datetime(today.year, today.month, 1).strftime("%Y-%m-%d")
+    if not end_date:
+        # Mặc định là ngày hiện tại
+        end_date = today.strftime("%Y-%m-%d")
+    return start_date, end_date
+
+
+def _epoch_to_text(ts):
+    return (datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=ts)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def build_attendance_report(conn, start_date, end_date, department=None, employee_id=None,
+                            shift=shift_engine.DEFAULT_SHIFT, employee_id_range=None, no_department=False):
+    """Tạo báo cáo chấm công theo ngày công cho các nhân viên thỏa điều kiện lọc.
+
+    Dữ liệu được đọc theo thứ tự (nhân viên, thời gian) và mỗi nhân viên được xử lý
+    trong một lượt duyệt bằng ShiftAccumulator. employee_id_range (tùy chọn, (min, max))
+    giới hạn báo cáo trong một dải id nhân viên, no_department chỉ lấy nhân viên chưa có bộ phận;
+    hai tham số này dùng khi chia báo cáo thành nhiều phần.
+    """
+    template = shift_engine.load_shift_templates()[shift]
+    range_from, range_to = template.range_bounds(start_date, end_date)
+
+    query_parts = [REPORT_QUERY]
+    query_params = [_epoch_to_text(range_from), _epoch_to_text(range_to)]
+
+    if department:
+        query_parts.append("AND e.department = ?")
+        query_params.append(department)
+
+    if employee_id:
+        query_parts.append("AND e.id = ?")
+        query_params.append(employee_id)
+
+    if employee_id_range is not None:
+        query_parts.append("AND e.id BETWEEN ? AND ?")
+        query_params.extend(employee_id_range)
+
+    if no_department:
+        query_parts.append("AND (e.department IS NULL OR e.department = '')")
+
+    query_parts.append("ORDER BY e.id, a.timestamp")
+
+    cursor = conn.execute(" ".join(query_parts), query_params)
+
+    direction_cache = lookups.caches["direction"]
+    device_cache = lookups.caches["device_name"]
+
+    report_list = []
+    employee = None
+    accumulator = None
+
+    for row in cursor:
+        if employee is None or employee["employee_id"] != row["id"]:
+            if employee is not None:
+                _finish_employee(employee, accumulator)
+            employee = {
+                "employee_id": row["id"],
+                "name": row["name"],
+                "id_card": row["id_card"],
+                "department": row["department"],
+                "position": row["position"],
+                "days": {}
+            }
+            report_list.append(employee)
+            accumulator = shift_engine.ShiftAccumulator(template)
+
+        ts = row["ts"]
+        direction = direction_cache.decode(conn, row["direction_id"])
+        if ts is None or direction not in ("in", "out"):
+            continue
+
+        work_day = accumulator.add(ts, direction)
+        date = shift_engine.day_label(work_day)
+        day = employee["days"].get(date)
+        if day is None:
+            day = employee["days"][date] = {"in": [], "out": []}
+
+        day[direction].append({
+            "time": row["timestamp"][11:19],
+            "device": device_cache.decode(conn, row["device_name_id"])
+        })
+
+    if employee is not None:
+        _finish_employee(employee, accumulator)
+
+    return report_list
+
+
+def _finish_employee(employee, accumulator):
+    # Tính giờ làm theo các đoạn vào/ra đã ghép và tổng hợp cho nhân viên
+    total_work_seconds = 0
+    days_with_records = 0
+
+    for date, day in employee["days"].items():
+        seconds = accumulator.seconds.get(shift_engine.date_to_epoch(date) // shift_engine.DAY)
+        if seconds:
+            days_with_records += 1
+            total_work_seconds += seconds
+            day["work_hours"] = round(seconds / 3600, 2)
+
+    total_days = len(employee["days"])
+    total_work_hours = total_work_seconds / 3600
+    employee["summary"] = {
+        "total_days": total_days,
+        "days_with_records": days_with_records,
+        "average_work_hours": round(total_work_hours / days_with_records, 2) if days_with_records > 0 else 0,
+        "attendance_rate": round((days_with_records / total_days) * 100, 2) if total_days > 0 else 0
+    }
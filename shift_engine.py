@@ -0,0 +1,169 @@
+import datetime
+import json
+import os
+import time
+from functools import lru_cache
+
+DAY = 86400
+EPOCH_DATE = datetime.date(1970, 1, 1)
+
+# File cấu hình ca làm việc (tùy chọn), dạng:
+# {"night": {"start": "22:00", "end": "06:00", "max_segment_hours": 14}}
+SHIFT_TEMPLATES_FILE = "shift_templates.json"
+DEFAULT_SHIFT = "day"
+
+
+def parse_clock(value):
+    """'HH:MM' hoặc 'HH:MM:SS' -> số giây tính từ nửa đêm."""
+    parts = [int(p) for p in value.split(":")]
+    while len(parts) < 3:
+        parts.append(0)
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+@lru_cache(maxsize=None)
+def day_label(work_day):
+    """Số thứ tự ngày (tính từ 1970-01-01) -> 'YYYY-MM-DD'."""
+    return (EPOCH_DATE + datetime.timedelta(days=work_day)).isoformat()
+
+
+def date_to_epoch(date_str):
+    """'YYYY-MM-DD' -> epoch giây lúc 00:00 của ngày đó (giờ địa phương của thiết bị, coi như UTC)."""
+    return (datetime.date.fromisoformat(date_str) - EPOCH_DATE).days * DAY
+
+
+class ShiftTemplate:
+    """Mẫu ca làm việc: giờ bắt đầu, giờ kết thúc (có thể qua nửa đêm) và độ dài tối đa
+    của một đoạn vào/ra.
+
+    Ranh giới ngày công nằm giữa khoảng nghỉ giữa hai ca, nên lượt ra lúc 06:00 của ca
+    đêm 22:00-06:00 vẫn được tính cho ngày bắt đầu ca.
+    """
+
+    def __init__(self, name, start="08:00", end="17:00", max_segment_hours=16):
+        self.name = name
+        self.start = parse_clock(start)
+        self.end = parse_clock(end)
+        self.crosses_midnight = self.end <= self.start
+        duration = (self.end - self.start) % DAY or DAY
+        self.day_boundary = (self.end + (DAY - duration) // 2) % DAY
+        self.max_segment = int(max_segment_hours * 3600)
+
+    def work_day(self, ts):
+        return (ts - self.day_boundary) // DAY
+
+    def range_bounds(self, start_date, end_date):
+        """Khoảng epoch [from, to) chứa mọi lượt chấm công của các ngày công start_date..end_date."""
+        return (
+            date_to_epoch(start_date) + self.day_boundary,
+            date_to_epoch(end_date) + DAY + self.day_boundary
+        )
+
+
+def load_shift_templates(path=SHIFT_TEMPLATES_FILE):
+    templates = {
+        "day": ShiftTemplate("day", "08:00", "17:00"),
+        "night": ShiftTemplate("night", "22:00", "06:00", max_segment_hours=14)
+    }
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for name, config in json.load(f).items():
+                templates[name] = ShiftTemplate(name, **config)
+    return templates
+
+
+class ShiftAccumulator:
+    """Ghép các lượt vào/ra của MỘT nhân viên thành các đoạn làm việc, trong một lượt duyệt.
+
+    Các lượt phải được đưa vào theo thứ tự thời gian tăng dần. Quy tắc ghép:
+    - 'in' mở một đoạn; 'in' lặp lại khi đoạn đang mở thì bỏ qua (giữ lượt sớm nhất),
+      trừ khi đoạn đang mở đã quá max_segment (quên chấm ra) thì mở đoạn mới.
+    - 'out' đóng đoạn đang mở.
+    - 'out' không có đoạn mở thì kéo dài đoạn vừa đóng nếu vẫn trong max_segment.
+    Mỗi đoạn được tính cho ngày công của lượt vào.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.seconds = {}
+        self._open_in = None
+        self._open_day = None
+        self._last_in = None
+        self._last_out = None
+        self._last_day = None
+
+    def add(self, ts, direction):
+        """Thêm một lượt chấm công, trả về ngày công (số nguyên) mà lượt đó thuộc về."""
+        template = self.template
+        if direction == "in":
+            if self._open_in is not None and ts - self._open_in <= template.max_segment:
+                return self._open_day
+            self._open_in = ts
+            self._open_day = template.work_day(ts)
+            return self._open_day
+
+        if direction == "out":
+            if self._open_in is not None and ts - self._open_in <= template.max_segment:
+                day = self._open_day
+                self.seconds[day] = self.seconds.get(day, 0) + ts - self._open_in
+                self._last_in, self._last_out, self._last_day = self._open_in, ts, day
+                self._open_in = None
+                return day
+            self._open_in = None
+            if self._last_out is not None and ts - self._last_in <= template.max_segment:
+                day = self._last_day
+                self.seconds[day] += ts - self._last_out
+                self._last_out = ts
+                return day
+
+        return template.work_day(ts)
+
+
+def compute_work_seconds(punches, template):
+    """Tiện ích: punches là dãy (ts, direction) đã sắp xếp -> {ngày công: số giây làm việc}."""
+    accumulator = ShiftAccumulator(template)
+    for ts, direction in punches:
+        accumulator.add(ts, direction)
+    return accumulator.seconds
+
+
+def _synthetic_punches(days, seed):
+    # Ca ngày có nghỉ trưa: vào ~08:00, ra/vào nghỉ trưa, ra ~17:00
+    punches = []
+    jitter = seed % 600
+    for day in range(days):
+        base = (19723 + day) * DAY
+        punches.append((base + 8 * 3600 + jitter, "in"))
+        punches.append((base + 12 * 3600 + jitter, "out"))
+        punches.append((base + 13 * 3600 + jitter, "in"))
+        punches.append((base + 17 * 3600 + jitter, "out"))
+    return punches
+
+
+def benchmark(employees=5000, days=365):
+    template = load_shift_templates()[DEFAULT_SHIFT]
+    data = [_synthetic_punches(days, emp) for emp in range(employees)]
+    total = sum(len(p) for p in data)
+
+    started = time.perf_counter()
+    for punches in data:
+        compute_work_seconds(punches, template)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "employees": employees,
+        "days": days,
+        "punches": total,
+        "seconds": round(elapsed, 3),
+        "punches_per_second": round(total / elapsed) if elapsed else None
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark shift engine")
+    parser.add_argument("--employees", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.employees, args.days), indent=4))
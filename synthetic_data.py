@@ -0,0 +1,193 @@
+import datetime
+import itertools
+import json
+import random
+
+import lookups
+
+# Dữ liệu giả lập cho benchmark: nhân viên, thiết bị và sự kiện RecPush cùng cấu trúc "info"
+# mà thiết bị nhận diện khuôn mặt gửi qua MQTT.
+
+FAMILY_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ"]
+MIDDLE_NAMES = ["Văn", "Thị", "Hữu", "Đức", "Minh", "Ngọc", "Thanh", "Quang"]
+GIVEN_NAMES = ["An", "Bình", "Châu", "Dũng", "Giang", "Hà", "Hải", "Hiếu", "Hùng", "Khánh", "Linh", "Long",
+               "Mai", "Nam", "Phúc", "Quân", "Sơn", "Thảo", "Trang", "Tuấn", "Vy", "Yến"]
+DEPARTMENTS = ["Kế toán", "Nhân sự", "Kỹ thuật", "Kinh doanh", "Sản xuất", "Kho vận", "IT"]
+POSITIONS = ["Nhân viên", "Trưởng nhóm", "Phó phòng", "Trưởng phòng"]
+
+
+def generate_employees(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        {
+            "person_id": f"P{i:08d}",
+            "id_card": 100000 + i,
+            "name": f"{rng.choice(FAMILY_NAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(GIVEN_NAMES)}",
+            "department": rng.choice(DEPARTMENTS),
+            "position": rng.choice(POSITIONS)
+        }
+        for i in range(count)
+    ]
+
+
+def generate_devices(count):
+    return [{"device_id": f"{1736631 + i}", "name": f"Cổng {i + 1}"} for i in range(count)]
+
+
+def iter_recpush_events(employees, devices, start_date="2025-01-01", days=30, punches_per_day=2, seed=42):
+    """Sinh các payload RecPush theo thứ tự thời gian, từng ngày một (không giữ toàn bộ trong bộ nhớ).
+
+    Mỗi nhân viên có punches_per_day lượt/ngày, xen kẽ vào/ra quanh ca 08:00-17:00.
+    """
+    rng = random.Random(seed)
+    day0 = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+    record_id = 0
+    for day in range(days):
+        base = day0 + datetime.timedelta(days=day)
+        punches = []
+        for employee in employees:
+            span = 9 * 3600
+            step = span // max(punches_per_day - 1, 1)
+            for p in range(punches_per_day):
+                offset = 8 * 3600 + p * step + rng.randint(-900, 900)
+                punches.append((offset, p, employee))
+        punches.sort(key=lambda punch: punch[0])
+        for offset, p, employee in punches:
+            record_id += 1
+            device = devices[rng.randrange(len(devices))]
+            yield {
+                "operator": "RecPush",
+                "info": {
+                    "deviceID": device["device_id"],
+                    "facesluiceName": device["name"],
+                    "personId": employee["person_id"],
+                    "idCard": str(employee["id_card"]),
+                    "persionName": employee["name"],
+                    "RecordID": str(record_id),
+                    "time": (base + datetime.timedelta(seconds=offset)).strftime("%Y-%m-%d %H:%M:%S"),
+                    "direction": "in" if p % 2 == 0 else "out",
+                    "VerifyStatus": "1",
+                    "PushType": "0",
+                    "OpendoorWay": "0"
+                }
+            }
+
+
+def scale(rows, employees=None, punches_per_day=2):
+    """Chọn số nhân viên/số ngày để sinh khoảng `rows` bản ghi chấm công."""
+    if employees is None:
+        employees = max(10, min(50000, rows // (punches_per_day * 250)))
+    days = max(1, -(-rows // (employees * punches_per_day)))
+    return employees, days
+
+
+def to_import_record(payload):
+    """Payload RecPush -> bản ghi dạng all_recpush_sorted_by_idcard.json (giống test.py)."""
+    info = payload["info"]
+    return {
+        "idCard": int(info.get("idCard", 0)),
+        "persionName": info.get("persionName", ""),
+        "personId": info.get("personId", ""),
+        "RecordID": info.get("RecordID", ""),
+        "time": info.get("time", ""),
+        "VerifyStatus": info.get("VerifyStatus", ""),
+        "direction": info.get("direction", ""),
+        "facesluiceName": info.get("facesluiceName", ""),
+        "PushType": info.get("PushType", ""),
+        "OpendoorWay": info.get("OpendoorWay", ""),
+        "mqtt": info
+    }
+
+
+def write_import_file(path, events):
+    records = sorted((to_import_record(e) for e in events), key=lambda x: x["idCard"])
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False)
+    return len(records)
+
+
+def write_jsonl(path, events):
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def populate_db(conn, employees, devices, events, batch_size=10000):
+    """Nạp thẳng dữ liệu giả lập vào DB đã có schema, theo lô executemany."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO employees (person_id, id_card, name, department, position) VALUES (?, ?, ?, ?, ?)",
+        [(e["person_id"], e["id_card"], e["name"], e["department"], e["position"]) for e in employees]
+    )
+    for device in devices:
+        lookups.devices.touch(conn, device["device_id"], device["name"])
+    employee_ids = dict(conn.execute("SELECT person_id, id FROM employees"))
+
+    count = 0
+    batch = []
+    for event in events:
+        info = event["info"]
+        codes = lookups.encode_values(conn, {
+            "direction": info["direction"],
+            "verify_status": info["VerifyStatus"],
+            "device_name": info["facesluiceName"],
+            "open_door_way": info["OpendoorWay"],
+            "push_type": info["PushType"]
+        })
+        batch.append((
+            employee_ids.get(info["personId"]), info["personId"], info["RecordID"], info["time"],
+            codes["direction_id"], codes["verify_status_id"], codes["device_name_id"],
+            codes["open_door_way_id"], codes["push_type_id"], json.dumps(info)
+        ))
+        if len(batch) >= batch_size:
+            count += _flush(conn, batch)
+            batch = []
+    if batch:
+        count += _flush(conn, batch)
+    conn.commit()
+    return count
+
+
+def _flush(conn, batch):
+    conn.executemany(
+        """
+        INSERT INTO attendance
+        (employee_id, person_id, record_id, timestamp, direction_id, verify_status_id, device_name_id, open_door_way_id, push_type_id, raw_data)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        batch
+    )
+    return len(batch)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu chấm công giả lập")
+    parser.add_argument("--rows", type=int, default=10000, help="số bản ghi chấm công cần sinh")
+    parser.add_argument("--employees", type=int, default=None)
+    parser.add_argument("--devices", type=int, default=5)
+    parser.add_argument("--punches-per-day", type=int, default=2)
+    parser.add_argument("--start-date", default="2025-01-01")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["import", "jsonl"], default="jsonl",
+                        help="import: file all_recpush_sorted_by_idcard.json; jsonl: mỗi dòng một payload RecPush")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    employee_count, days = scale(args.rows, args.employees, args.punches_per_day)
+    employees = generate_employees(employee_count, args.seed)
+    devices = generate_devices(args.devices)
+    events = itertools.islice(
+        iter_recpush_events(employees, devices, args.start_date, days, args.punches_per_day, args.seed),
+        args.rows
+    )
+
+    if args.format == "import":
+        written = write_import_file(args.output or "all_recpush_sorted_by_idcard.json", events)
+    else:
+        written = write_jsonl(args.output or "recpush_events.jsonl", events)
+    print(f"✅ Đã sinh {written} bản ghi ({employee_count} nhân viên x {days} ngày)")
@@ -0,0 +1,237 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import lookups
+import metrics
+
+# Gom các lệnh ghi đang chờ (tối đa WRITE_BATCH_MAX_ROWS dòng) vào một transaction. Mặc định không chờ thêm:
+# các lệnh đến trong lúc lô trước đang commit sẽ tự gom thành lô sau; tăng WRITE_BATCH_WINDOW_MS
+# để gom lô lớn hơn khi tải ghi rất cao (đổi lại tăng độ trễ mỗi lệnh).
+WRITE_BATCH_MAX_ROWS = int(os.environ.get("WRITE_BATCH_MAX_ROWS", "1000"))
+WRITE_BATCH_WINDOW_MS = float(os.environ.get("WRITE_BATCH_WINDOW_MS", "0"))
+# Thời gian tối đa execute() chờ một lệnh ghi (gồm cả thời gian xếp hàng); 0 = chờ mãi
+WRITE_TIMEOUT_SECONDS = float(os.environ.get("WRITE_TIMEOUT_SECONDS", "30"))
+
+
+class WriteTimeout(sqlite3.OperationalError):
+    """Lệnh ghi không hoàn tất trong thời gian chờ (hàng đợi bị nghẽn hoặc DB bị khóa quá lâu)."""
+
+
+class WriteQueue:
+    """Bộ ghi duy nhất cho DB: mọi lệnh ghi được gửi vào hàng đợi và chạy trên một thread riêng.
+
+    submit(fn) trả về Future; fn(conn) chạy trong transaction chung của cả lô, mỗi lệnh
+    nằm trong một SAVEPOINT riêng nên lệnh lỗi chỉ bị hủy phần của nó. Future chỉ được
+    resolve (với giá trị fn trả về, ví dụ id dòng vừa thêm) sau khi lô đã COMMIT.
+    Không được gọi conn.commit() bên trong fn. Trạng thái trong bộ nhớ mà fn cập nhật theo
+    lệnh ghi thì đăng ký hàm hoàn tác bằng on_rollback() để chạy khi phần ghi đó bị hủy.
+    """
+
+    def __init__(self, db_path, max_rows=WRITE_BATCH_MAX_ROWS, window_ms=WRITE_BATCH_WINDOW_MS):
+        # db_path là hàm trả về đường dẫn DB hiện tại (DB_FILE có thể đổi, ví dụ khi benchmark)
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+        self._conn = None
+        self._conn_path = None
+        self._thread = None
+        self._item_rollbacks = []
+        self._batch_rollbacks = []
+        self._start_lock = threading.Lock()
+        self._stats = {"batches": 0, "items": 0, "rows": 0, "failed_items": 0}
+
+    def submit(self, fn, rows=1):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((fn, rows, future))
+        return future
+
+    def execute(self, fn, rows=1, timeout=WRITE_TIMEOUT_SECONDS):
+        """Gửi lệnh ghi và chờ kết quả, tối đa timeout giây (None/0 = chờ mãi).
+
+        Hết giờ thì lệnh còn trong hàng đợi bị hủy; lệnh đã bắt đầu chạy vẫn có thể được commit.
+        """
+        future = self.submit(fn, rows)
+        try:
+            return future.result(timeout=timeout or None)
+        except FutureTimeoutError:
+            future.cancel()
+            raise WriteTimeout(f"Write not completed within {timeout:g}s") from None
+
+    def on_rollback(self, callback):
+        """Chỉ gọi bên trong fn: callback() chạy (trên thread ghi) nếu phần ghi của fn bị hủy,
+        do chính fn lỗi hoặc do cả lô không COMMIT được."""
+        self._item_rollbacks.append(callback)
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    # Các số liệu tăng dần trong stats()
+    COUNTERS = (
+        "attendance_write_batches_total", "attendance_write_items_total",
+        "attendance_write_rows_total", "attendance_write_failed_items_total"
+    )
+
+    def stats(self):
+        """Số liệu hàng đợi cho /metrics."""
+        stats = {("attendance_write_queue_depth", ()): self._queue.qsize()}
+        for name, value in self._stats.items():
+            stats[(f"attendance_write_{name}_total", ())] = value
+        return stats
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            # Tạo lại thread nếu thread cũ đã dừng (lệnh trong hàng đợi vẫn được xử lý tiếp)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+                self._thread.start()
+
+    def _connection(self):
+        path = self.db_path()
+        if self._conn is None or self._conn_path != path:
+            if self._conn is not None:
+                self._conn.close()
+            if metrics.ENABLED:
+                conn = sqlite3.connect(path, timeout=30, isolation_level=None, factory=metrics.InstrumentedConnection)
+            else:
+                conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # WAL cho phép đọc song song trong khi ghi
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._conn = conn
+            self._conn_path = path
+        return self._conn
+
+    def _drop_connection(self):
+        """Đóng kết nối (hủy transaction dở nếu có); lô sau sẽ mở kết nối mới."""
+        conn, self._conn, self._conn_path = self._conn, None, None
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def _run(self):
+        # Kết nối chỉ dùng được trên thread đã tạo nó, nên thread mới luôn mở kết nối mới
+        self._conn = None
+        self._conn_path = None
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            rows = item[1]
+            deadline = time.monotonic() + self.window
+            while rows < self.max_rows:
+                try:
+                    # Lấy ngay những lệnh đang chờ; nếu hết thì đợi thêm tối đa tới deadline
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                rows += item[1]
+            try:
+                self._process(batch)
+            except BaseException as e:
+                # Lỗi ngoài dự kiến: không để thread ghi chết và caller chờ mãi
+                self._rollback_state(self._batch_rollbacks + self._item_rollbacks)
+                self._drop_connection()
+                lookups.invalidate_caches()
+                _fail_pending(batch, e)
+
+    def _process(self, batch):
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            _fail_pending(batch, e)
+            return
+
+        done = []
+        self._batch_rollbacks = []
+        for fn, item_rows, future in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._item_rollbacks = []
+            conn.execute("SAVEPOINT write_item")
+            try:
+                result = fn(conn)
+                conn.execute("RELEASE write_item")
+                done.append((future, result, item_rows))
+                self._batch_rollbacks += self._item_rollbacks
+                self._item_rollbacks = []
+            except BaseException as e:
+                self._rollback_state(self._item_rollbacks)
+                self._item_rollbacks = []
+                if not conn.in_transaction:
+                    # SQLite đã tự rollback cả transaction (ví dụ SQLITE_FULL): các lệnh trước
+                    # trong lô cũng mất, nên hủy cả lô
+                    future.set_exception(e)
+                    self._rollback_state(self._batch_rollbacks)
+                    self._batch_rollbacks = []
+                    raise sqlite3.OperationalError(f"Write batch rolled back: {e}") from e
+                conn.execute("ROLLBACK TO write_item")
+                conn.execute("RELEASE write_item")
+                # Giá trị tra cứu vừa thêm có thể đã bị hủy cùng savepoint
+                lookups.invalidate_caches()
+                self._stats["failed_items"] += 1
+                future.set_exception(e)
+
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            self._rollback_state(self._batch_rollbacks)
+            self._batch_rollbacks = []
+            lookups.invalidate_caches()
+            for future, _, _ in done:
+                future.set_exception(e)
+            return
+
+        self._batch_rollbacks = []
+        self._stats["batches"] += 1
+        self._stats["items"] += len(done)
+        # Chỉ đếm dòng của các lệnh đã commit (không tính lệnh lỗi/bị hủy)
+        self._stats["rows"] += sum(item_rows for _, _, item_rows in done)
+        for future, result, _ in done:
+            future.set_result(result)
+
+    @staticmethod
+    def _rollback_state(callbacks):
+        # Hoàn tác theo thứ tự ngược lại với lúc cập nhật
+        for callback in reversed(callbacks):
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ Hoàn tác trạng thái sau rollback thất bại: {e}")
+
+
+def _fail_pending(batch, error):
+    """Báo lỗi cho mọi Future trong lô chưa có kết quả."""
+    for _, _, future in batch:
+        if future.done():
+            continue
+        if future.running() or future.set_running_or_notify_cancel():
+            future.set_exception(error)